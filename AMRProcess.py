@@ -13,12 +13,34 @@ import threading
 import time
 import os
 import enum
+import collections
+
+#Global Functions
+from MeterRegistry import registryInit, getRegistry, INVALID_DEVICE_NUMBER
+from ReadoutTemplate import getBrandTemplate
+from BrandRegistry import registerBrand, getBrandPlugin, knownBrandCodes, isBrandPluginPending
 
 #Constant Definitions
 SERIAL_NO_LENGTH = 8
+REPORT_EXAMPLE_COUNT = 10
 DEBUG_AMR_ENABLE = True
 READ_OUT_COMMANDS = ["0"+str(_)+"0" for _ in range(6)]
 
+#Protocol Timing Definitions (seconds, simulated time)
+REACTION_TIME_MIN = 0.200 # IEC 62056-21 tr min
+REACTION_TIME_MAX = 1.500 # IEC 62056-21 tr max
+READOUT_REACTION_DELAY = 1.100 # legal delay (<1.5s)
+READ_POLL_DELAY = 0.01
+PARTIAL_SEND_DELAY = 0.1
+ACKNOWLEDGE_TIMEOUT = 1.500 # option select should follow identification within tr max, otherwise meter returns to start
+READOUT_STUCK_TIMEOUT = 60.000 # line still busy this long after its readout should be drained is reset
+SESSION_RETENTION_TIME = 600.000 # idle sessions are dropped from registry after this
+SESSION_WATCHDOG_INTERVAL = 10.000
+
+#Unknown Serial Number Log Definitions (seconds, wall clock)
+UNKNOWN_SERIAL_LOG_INTERVAL = 10.0
+UNKNOWN_SERIAL_LOG_BURST = 5 # unknown serial numbers printed per interval, others are only counted
+
 @enum.unique
 class IEC_MAGIC_BYTES(enum.IntEnum):
     STX = 0x02 # start of frame
@@ -38,14 +60,21 @@ class AMRParams:
     serialNo = ["", "", "", ""]
     brand = ["", "", "", ""]
     enable = [0, 0, 0, 0]
-    requestedSerialNo = ""
     baudrateInStart = 300
     baudrateInRuntime = 9600
-    deviceNumber = -1
     comPortName = ""
     parity = ""
     stopBit = 1
     dataBit = 8
+    clockMode = "REAL"
+    clockScale = 1.0
+    busMode = False
+    fleetFile = ""
+    stateFile = ""
+    controlAddress = ""
+    lineRateEmulation = False
+    traceDir = ""
+    sharedReadoutStore = False
     
     def baud_to_iec(baud):
         if baud == 300:
@@ -79,25 +108,98 @@ class AMRParams:
         else:
             return None
 
+#Problems found in meter list, device numbers of bad entries are kept per problem
+class MeterListReport:
+    def __init__(self, meterCount):
+        self.meterCount = meterCount
+        # {list name: length}, filled when brand or enable list length differs from serial no list
+        self.listMismatches = {}
+        self.badLengths = []
+        self.nonNumeric = []
+        # {serial no: [device numbers]}, first device number is the meter answering sign-on
+        self.duplicates = {}
+        # {brand: [device numbers]}
+        self.unknownBrands = {}
+
+    @property
+    def valid(self):
+        return not (self.listMismatches or self.badLengths or self.nonNumeric or self.duplicates or self.unknownBrands)
+
+    def asDict(self):
+        return {"valid": self.valid,
+                "meters": self.meterCount,
+                "listMismatches": self.listMismatches,
+                "badLengths": self.badLengths,
+                "nonNumeric": self.nonNumeric,
+                "duplicates": self.duplicates,
+                "unknownBrands": self.unknownBrands}
+
+    #Returns one error line per problem, at most REPORT_EXAMPLE_COUNT entries are listed in a line
+    def errorLines(self):
+        def examples(items):
+            items = list(items)
+            text = ", ".join(str(_) for _ in items[:REPORT_EXAMPLE_COUNT])
+            return text + (" ... (" + str(len(items)) + " in total)" if len(items) > REPORT_EXAMPLE_COUNT else "")
+
+        lines = []
+        for name, length in self.listMismatches.items():
+            lines.append(name + " has " + str(length) + " entries, MeterSerialNumbers has " + str(self.meterCount))
+        if self.badLengths:
+            lines.append("serial no length should be " + str(SERIAL_NO_LENGTH) + " digits, device numbers: " + examples(self.badLengths))
+        if self.nonNumeric:
+            lines.append("serial no should only have digits, device numbers: " + examples(self.nonNumeric))
+        if self.duplicates:
+            lines.append("duplicated serial no (device numbers): " +
+                         examples(serial + " " + str(deviceNumbers) for serial, deviceNumbers in self.duplicates.items()))
+        for brand, deviceNumbers in self.unknownBrands.items():
+            lines.append("unknown brand " + repr(brand) + ", device numbers: " + examples(deviceNumbers))
+        return lines
+
+#Validates whole meter list, checks run over whole lists at once and entries are only located when a check fails
+#index is the {serial no: device number} map of registry if it is already built
+def validateMeterList(serialNo, brand, enable, index = None, knownBrands = None):
+    report = MeterListReport(len(serialNo))
+    if len(brand) != len(serialNo):
+        report.listMismatches["MeterBrandName"] = len(brand)
+    if len(enable) != len(serialNo):
+        report.listMismatches["CommunicationEnable"] = len(enable)
+
+    if set(map(len, serialNo)) - {SERIAL_NO_LENGTH}:
+        report.badLengths = [deviceNumber for deviceNumber, serial in enumerate(serialNo) if len(serial) != SERIAL_NO_LENGTH]
+    if not all(map(str.isdigit, serialNo)):
+        report.nonNumeric = [deviceNumber for deviceNumber, serial in enumerate(serialNo) if not serial.isdigit()]
+
+    if (len(index) if index is not None else len(set(serialNo))) != len(serialNo):
+        duplicated = {serial for serial, count in collections.Counter(serialNo).items() if count > 1}
+        for deviceNumber in [_ for _, serial in enumerate(serialNo) if serial in duplicated]:
+            report.duplicates.setdefault(serialNo[deviceNumber], []).append(deviceNumber)
+
+    # empty brand is valid, such meters send the no brand readout
+    if knownBrands is None:
+        knownBrands = knownBrandCodes()
+    unknownBrands = set(brand) - knownBrands - {""}
+    for unknownBrand in sorted(unknownBrands, key = str):
+        report.unknownBrands[unknownBrand] = [deviceNumber for deviceNumber, _ in enumerate(brand) if _ == unknownBrand]
+    return report
+
 #Checks the validty of serial list defined in AMRParams.json by user
 def checkUserSerialList():
-    success = True
+    registry = getRegistry()
+    report = validateMeterList(AMRParams.serialNo, AMRParams.brand, AMRParams.enable,
+                               registry.index if registry is not None and len(registry) == len(AMRParams.serialNo) else None)
+    if not report.valid:
+        print("ERROR_AMR: Please Check User Defined Serial No List!")
+        for line in report.errorLines():
+            print("ERROR_AMR: " + line)
+    return report.valid
 
-    for i in range(0, len(AMRParams.serialNo)):
-        if len(AMRParams.serialNo[i]) != SERIAL_NO_LENGTH:
-            print("ERROR_AMR: Please Check User Defined Serial No List!")
-            print("HINT_AMR: Serial No length should exist from 8 Digits!")
-            success = False
+#Checks the reaction time of meter against IEC 62056-21 timing window
+def checkReactionTime(elapsed):
+    if REACTION_TIME_MIN <= elapsed <= REACTION_TIME_MAX:
+        return True
 
-    for i in range(0, len(AMRParams.serialNo)):
-        try:
-            int (AMRParams.serialNo[i])
-        except ValueError:
-            print("ERROR_AMR: Please Check User Defined Serial No List!")
-            print("HINT_AMR: There should not be any string character in serial no!")
-            success = False
-
-    return success
+    print("WARNING_AMR: Reaction time is out of IEC timing window: " + "{:.3f}".format(elapsed) + " s")
+    return False
 
 #Gets substring between two special character or string
 def getSubString(s, first, last):
@@ -122,75 +224,100 @@ def getSerialNo(inputStr):
 
     return requestedSerialNo
 
-#Checks the requested serial number from AMRParams.json
-#If serial number could not exist, user would be informed by console
-def checkSeriaNoFromSerialList(requestedSerialNo):
-    checkSerialNo = False
-    for i in range(0, len(AMRParams.serialNo)):
-        if requestedSerialNo == AMRParams.serialNo[i]:
-            if DEBUG_AMR_ENABLE:
-                print ("DEBUG_AMR: Requested serial number is exist in Serial Device List")
-            checkSerialNo = True
+#Logs sign-ons of serial numbers which are not simulated
+#Concentrators sweep whole address ranges, so only first few misses of an interval are printed
+class UnknownSerialLog:
+    def __init__(self, interval = UNKNOWN_SERIAL_LOG_INTERVAL, burst = UNKNOWN_SERIAL_LOG_BURST, clock = time.monotonic):
+        self.interval = interval
+        self.burst = burst
+        self.clock = clock
+        self.count = 0
+        self.windowStart = None
+        self.windowCount = 0
+        self.suppressedCount = 0
 
-    if checkSerialNo == False:
-        print ("ERROR_AMR: Requested serial number does not exist in Serial Device List!")
-        print ("ERROR_AMR: Requested Serial Number: " + requestedSerialNo)
-    
-    return checkSerialNo
+    #Counts miss, quiet misses (bus mode, where other meters answer them) are never printed
+    def log(self, requestedSerialNo, quiet = False):
+        self.count += 1
+        if quiet:
+            return
+        now = self.clock()
+        if self.windowStart is None or now - self.windowStart >= self.interval:
+            if self.suppressedCount:
+                print("ERROR_AMR: " + str(self.suppressedCount) + " more unknown serial numbers were requested")
+            self.windowStart = now
+            self.windowCount = 0
+            self.suppressedCount = 0
+        if self.windowCount < self.burst:
+            self.windowCount += 1
+            print("ERROR_AMR: Requested serial number does not exist in Serial Device List: " + requestedSerialNo)
+        else:
+            self.suppressedCount += 1
 
-#Creates response of handshake for start operation according to requested serial number
-def createStartMessageResponse (reqSerialNo):
-    deviceNumber = 0
-    startMessage = ""
-    
-    for i in range(0, len(AMRParams.serialNo)):
-        if reqSerialNo == AMRParams.serialNo[i]:
-            deviceNumber = i
-            AMRParams.deviceNumber = deviceNumber
-            print("deviceNumber:" + str(deviceNumber))
-    
-    if AMRParams.brand[deviceNumber] == "LUNA":
-        startMessage = "/LUN5<1>LUN" + str(AMRParams.serialNo[deviceNumber])
-    elif AMRParams.brand[deviceNumber] == "KOHLER":
-        startMessage =  "/AEL5<1>AEL.TF.21"
-        startMessage =  f"/LGZ{AMRParams.baud_to_iec(AMRParams.baudrateInRuntime)}ZMF100AC.M29"
-    elif AMRParams.brand[deviceNumber] == "MAKEL":
-        startMessage = "/MSY5<1>C500.KMY.2556"
-    elif AMRParams.brand[deviceNumber] == "VIKO":
-        startMessage = "/VIK5<1>VEMM" + str(AMRParams.serialNo[deviceNumber])
-    else:
+unknownSerialLog = UnknownSerialLog()
+
+#Resolves the meter addressed by sign-on, returns its device number or INVALID_DEVICE_NUMBER
+#Empty serial number (point to point sign-on) selects the first meter
+def resolveSignOn(requestedSerialNo, registry, busMode):
+    if len(requestedSerialNo) == 0:
+        # sign-on without address, on a shared bus every meter would answer at once
+        if busMode or len(registry) == 0:
+            return INVALID_DEVICE_NUMBER
+        return 0
+
+    # one hashed lookup serves hits and misses, misses of address sweeps are only counted after a few log lines
+    deviceNumber = registry.lookup(requestedSerialNo)
+    if deviceNumber == INVALID_DEVICE_NUMBER:
+        unknownSerialLog.log(requestedSerialNo, busMode)
+        return INVALID_DEVICE_NUMBER
+    if busMode:
+        return deviceNumber if registry.isEnabled(deviceNumber) else INVALID_DEVICE_NUMBER
+    if DEBUG_AMR_ENABLE:
+        print ("DEBUG_AMR: Requested serial number is exist in Serial Device List")
+    return deviceNumber
+
+#Creates identification message of meter according to its brand plugin
+def createIdentificationMessage(deviceNumber, registry, baudrateInRuntime):
+    plugin = getBrandPlugin(registry.getBrand(deviceNumber))
+    if plugin is None:
         startMessage = ""
+    else:
+        startMessage = plugin.createIdentificationMessage(str(registry.serialNo[deviceNumber]), baudrateInRuntime)
     startMessage+='\r\n'
     return startMessage
 
+#Returns encoded identification line of meter, lines are cached per meter and runtime baudrate in registry
+#Line of a meter whose brand plugin could not be loaded is not kept, plugin is tried again on next sign-on
+def getIdentification(deviceNumber, registry, baudrateInRuntime):
+    identification = registry.getIdentification(deviceNumber, baudrateInRuntime,
+                                                lambda deviceNumber, baudrate: createIdentificationMessage(deviceNumber, registry, baudrate).encode())
+    if isBrandPluginPending(registry.getBrand(deviceNumber)):
+        registry.dropIdentification(deviceNumber)
+    return identification
+
 #Inits AMR process
+#Meters are loaded from fleet binary file (FleetGenerator.py) when it is configured
 def amrInit():
     global checkUserSerialList
+    if AMRParams.fleetFile:
+        from FleetGenerator import loadFleet, applyFleet
+        applyFleet(loadFleet(AMRParams.fleetFile))
+    else:
+        registryInit()
     success = checkUserSerialList()
     return success
 
-#Checks requested serial no for starting to first handshake
-def amrSerialListCheckProcess (readBuffer):
-    opSuccess = False
-    if len(AMRParams.requestedSerialNo) == 0:
-        AMRParams.requestedSerialNo = '' # AMRParams.serialNo[0]
-        opSuccess = True
-    else:
-        AMRParams.requestedSerialNo = getSerialNo(readBuffer)
-        opSuccess = checkSeriaNoFromSerialList(AMRParams.requestedSerialNo)
-    
-    return opSuccess
-
 #Checks master query type
+#Sign-on is checked first, it is the most frequent request and its serial number may contain "000" like an option select
 def checkAMRQueryType(readBuffer):
-    if any([read_out in readBuffer for read_out in READ_OUT_COMMANDS]):
-        if DEBUG_AMR_ENABLE:
-            print("DEBUG_AMR: ReadOut State...")
-        return AMR_STATE.READOUT_PROCESS
-    elif "/?" in readBuffer and "!" in readBuffer:
+    if "/?" in readBuffer and "!" in readBuffer:
         if DEBUG_AMR_ENABLE:
             print("DEBUG_AMR: Start Process State...")
         return AMR_STATE.START_PROCESS
+    elif any([read_out in readBuffer for read_out in READ_OUT_COMMANDS]):
+        if DEBUG_AMR_ENABLE:
+            print("DEBUG_AMR: ReadOut State...")
+        return AMR_STATE.READOUT_PROCESS
     elif chr(IEC_MAGIC_BYTES.NCK) == readBuffer[0:1]:
         if DEBUG_AMR_ENABLE:
             print("DEBUG_AMR: Repeat (NCK) State...")
@@ -1100,16 +1227,43 @@ C.7.0(0064)
 '''
     return chr(IEC_MAGIC_BYTES.STX) + readoutStr + chr(IEC_MAGIC_BYTES.ETX) + chr(IEC_MAGIC_BYTES.BCC_LGZ)
 
-#Conditions the readout message according to meter brand names
+#Built-in Brand Definitions, other brands are loaded as plugins (see BrandRegistry.py)
+registerBrand("LUNA", createLunaReadoutResponse,
+              lambda serialNo, baudrateInRuntime: "/LUN5<1>LUN" + serialNo)
+registerBrand("MAKEL", createMakelReadoutResponse,
+              lambda serialNo, baudrateInRuntime: "/MSY5<1>C500.KMY.2556")
+registerBrand("VIKO", createVikoReadoutResponse,
+              lambda serialNo, baudrateInRuntime: "/VIK5<1>VEMM" + serialNo)
+registerBrand("KOHLER", createKohlerReadoutResponse,
+              lambda serialNo, baudrateInRuntime: "/LGZ" + str(AMRParams.baud_to_iec(baudrateInRuntime)) + "ZMF100AC.M29")
+
+#Conditions the readout message according to meter brand plugin
 def createReadoutMessage(meterBrand):
-    if meterBrand == "LUNA":
-        return(createLunaReadoutResponse())
-    elif meterBrand == "MAKEL":
-        return(createMakelReadoutResponse())
-    elif meterBrand == "VIKO":
-        return(createVikoReadoutResponse())
-    elif meterBrand == "KOHLER":
-        return(createKohlerReadoutResponse())
-    else:
+    plugin = getBrandPlugin(meterBrand)
+    if plugin is None:
         # no brand
         return(createNoBrandReadoutResponse())
+    return(plugin.createReadoutMessage())
+
+#Yields framed readout of meter in chunks from shared brand template and meter's own serial no and register offsets
+#Disabled or unknown meters get the no brand readout
+def iterReadoutFrame(deviceNumber, registry = None, getTemplate = getBrandTemplate):
+    if registry is None:
+        registry = getRegistry()
+    if not registry.isEnabled(deviceNumber):
+        return getTemplate(None).iterRender()
+
+    return getTemplate(registry.getBrand(deviceNumber)).iterRender(registry.serialNo[deviceNumber],
+                                                                         registry.registerOffsets.get(deviceNumber),
+                                                                         registry.getRegisterValues(deviceNumber))
+
+#Creates whole framed readout of meter, template image is copied and only changed fields are formatted
+def createReadoutFrame(deviceNumber, registry = None, getTemplate = getBrandTemplate):
+    if registry is None:
+        registry = getRegistry()
+    if not registry.isEnabled(deviceNumber):
+        return getTemplate(None).render()
+
+    return getTemplate(registry.getBrand(deviceNumber)).render(registry.serialNo[deviceNumber],
+                                                                registry.registerOffsets.get(deviceNumber),
+                                                                registry.getRegisterValues(deviceNumber))
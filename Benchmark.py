@@ -0,0 +1,380 @@
+#Benchmark .py file includes micro benchmarks of protocol hot paths and performance regression gate
+#Every case runs in repeated trials, median and MAD (median absolute deviation) of trials are compared
+#with the baseline of the same environment (Python version and CPU model) stored in history file
+#
+#    python Benchmark.py                   runs benchmarks and prints results
+#    python Benchmark.py --record          also appends results to history file
+#    python Benchmark.py --check           compares with baseline, exit code is 1 on regression
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+#Global Functions
+import AMRProcess
+from AMRProcess import checkAMRQueryType, getSerialNo, resolveSignOn, getIdentification, createReadoutFrame
+from AMRProcess import READOUT_REACTION_DELAY
+from MeterRegistry import MeterRegistry
+from ReadoutParser import ReadoutParser
+from ReadoutTemplate import getBrandTemplate
+from SerialComProcess import SerialLine
+from SessionScheduler import SessionScheduler
+from SimClock import VirtualClock
+from Simulator import Simulator, SimulatorConfig
+from Transport import Transport
+
+#Constant Definitions
+HISTORY_FORMAT_VERSION = 1
+DEFAULT_HISTORY_FILE = "benchmark_history.json"
+DEFAULT_TRIALS = 7
+DEFAULT_TRIAL_SECONDS = 0.2
+# relative slowdown which is always tolerated, even for very stable cases
+DEFAULT_THRESHOLD = 0.10
+# slowdown should also be larger than this many scaled MADs of baseline and current trials
+NOISE_FACTOR = 3.0
+MAD_SCALE = 1.4826 # MAD to standard deviation of normal distribution
+BASELINE_RUNS = 5
+MEMORY_RUNS = 10 # operations run while allocations of case are traced
+SWEEP_LENGTH = 1000 # sign-on requests of one address sweep, every second address is not simulated
+SEND_READOUT_DRAIN_STEP = 3600.0 # simulated seconds, longer than drain wait of any readout at 300 baud
+
+#Verdict Definitions
+VERDICT_OK = "ok"
+VERDICT_FASTER = "faster"
+VERDICT_REGRESSION = "REGRESSION"
+VERDICT_NEW = "new"
+
+#Transport dropping every written byte
+class NullTransport(Transport):
+    name = "null"
+
+    def write(self, payload):
+        return len(payload)
+
+#Benchmark Case Definitions
+#Every case returns (operation, processed bytes per operation, cleanup function or None)
+def caseCheckAMRQueryType():
+    request = "/?71234560!\r\n"
+    return (lambda: checkAMRQueryType(request)), len(request), None
+
+def caseGetSerialNo():
+    request = "/?71234560!\r\n"
+    return (lambda: getSerialNo(request)), len(request), None
+
+def caseResolveSignOn():
+    registry = benchmarkRegistry(10000)
+    serialNo = registry.serialNo[len(registry) // 2]
+    return (lambda: resolveSignOn(serialNo, registry, True)), len(serialNo), None
+
+def caseGetIdentification():
+    registry = benchmarkRegistry(4)
+    length = len(getIdentification(3, registry, 9600))
+    return (lambda: getIdentification(3, registry, 9600)), length, None
+
+#Readout path of serial line, from reaction delay until start baudrate is restored after drain wait
+def caseSendReadout():
+    clock = VirtualClock()
+    registry = benchmarkRegistry(4)
+    registry.setRegisterOffset(3, "1.8.0", 12.5)
+    line = SerialLine(NullTransport(), SessionScheduler(clock), SimulatorConfig(), registry)
+    length = len(createReadoutFrame(3, registry))
+
+    def send():
+        line.sendReadout(3, clock.now() - READOUT_REACTION_DELAY)
+        clock.advance(SEND_READOUT_DRAIN_STEP)
+        line.scheduler.runPending()
+    return send, length, None
+
+def caseCreateReadoutFrame():
+    registry = benchmarkRegistry(4)
+    registry.setRegisterOffset(0, "1.8.0", 12.5)
+    length = len(createReadoutFrame(0, registry))
+    return (lambda: createReadoutFrame(0, registry)), length, None
+
+def caseReadoutParser():
+    registry = benchmarkRegistry(4)
+    frame = createReadoutFrame(3, registry)
+    parser = ReadoutParser()
+    return (lambda: parser.feed(frame)), len(frame), None
+
+def caseSimulatorReadout():
+    registry = benchmarkRegistry(4)
+    simulator = Simulator(SimulatorConfig(registry.serialNo, registry.brand, registry.enable), clock = VirtualClock()).start()
+    serialNo = registry.serialNo[0]
+    length = simulator.requestReadout(serialNo).length
+    return (lambda: simulator.requestReadout(serialNo)), length, simulator.stop
+
+#Kohler readout, the longest built-in one, fully dynamic readout has an absolute value for every register field
+def dynamicKohlerValues():
+    template = getBrandTemplate("KOHLER")
+    return template, {code: 1234.5 + _ * 111.111 for _, code in enumerate(template.registerFields)}
+
+#Lower bound of readout rendering, static frame image is only copied into preallocated buffer
+def caseFrameImageCopy():
+    template = getBrandTemplate("KOHLER")
+    buffer = bytearray(template.frameLength)
+    imageLength = len(template.image)
+
+    def copy():
+        buffer[:imageLength] = template.image
+    return copy, template.frameLength, None
+
+#Lower bound of fully dynamic rendering, only the values of all register fields are formatted (one % operation)
+def caseFieldValueFormat():
+    template, values = dynamicKohlerValues()
+    slots = [slot for fields in template.registerFields.values() for _, slot in fields]
+    fieldsFormat = b''.join(slot.format for slot in slots)
+    fieldValues = tuple(values[slot.code] % slot.modulus for slot in slots)
+    return (lambda: fieldsFormat % fieldValues), template.frameLength, None
+
+def caseRenderIntoStatic():
+    template = getBrandTemplate("KOHLER")
+    buffer = bytearray(template.frameLength)
+    return (lambda: template.renderInto(buffer, 0, "71234560")), template.frameLength, None
+
+def caseRenderIntoDynamic():
+    template, values = dynamicKohlerValues()
+    buffer = bytearray(template.frameLength)
+    return (lambda: template.renderInto(buffer, 0, "71234560", None, values)), template.frameLength, None
+
+#Chunked rendering of streamed readouts, formats the same fields segment by segment
+def caseIterRenderDynamic():
+    template, values = dynamicKohlerValues()
+    return (lambda: b''.join(template.iterRender("71234560", None, values))), template.frameLength, None
+
+#Address sweep of a concentrator, one operation is a sweep of SWEEP_LENGTH sign-ons handled by serial line
+#Simulated serial numbers are spread over whole registry, unknown ones are interleaved with them
+#DEBUG_AMR lines of every sign-on are printed like in a running simulator, quiet sweep is run without them
+def caseSignOnSweep(meterCount, debug = True):
+    registry = benchmarkRegistry(meterCount)
+    line = SerialLine(NullTransport(), SessionScheduler(VirtualClock()), SimulatorConfig(), registry)
+    step = max(meterCount * 2 // SWEEP_LENGTH, 1)
+    requests = []
+    for _ in range(SWEEP_LENGTH // 2):
+        requests.append(("/?" + registry.serialNo[_ * step % meterCount] + "!\r\n").encode())
+        requests.append(("/?" + str(91234560 + _) + "!\r\n").encode())
+
+    def sweep():
+        for request in requests:
+            line.handleRequest(request, 0.0)
+
+    debugEnable = AMRProcess.DEBUG_AMR_ENABLE
+    AMRProcess.DEBUG_AMR_ENABLE = debug
+
+    def cleanup():
+        AMRProcess.DEBUG_AMR_ENABLE = debugEnable
+    return sweep, sum(len(_) for _ in requests), cleanup
+
+CASES = {"checkAMRQueryType": caseCheckAMRQueryType,
+         "getSerialNo": caseGetSerialNo,
+         "resolveSignOn": caseResolveSignOn,
+         "getIdentification": caseGetIdentification,
+         "SerialLine.sendReadout": caseSendReadout,
+         "createReadoutFrame": caseCreateReadoutFrame,
+         "ReadoutParser.feed": caseReadoutParser,
+         "Simulator.requestReadout": caseSimulatorReadout,
+         "frameImageCopy": caseFrameImageCopy,
+         "fieldValueFormat": caseFieldValueFormat,
+         "renderInto static": caseRenderIntoStatic,
+         "renderInto dynamic": caseRenderIntoDynamic,
+         "iterRender dynamic": caseIterRenderDynamic,
+         "signOnSweep 1k": functools.partial(caseSignOnSweep, 1000),
+         "signOnSweep 100k": functools.partial(caseSignOnSweep, 100000),
+         "signOnSweep 1M": functools.partial(caseSignOnSweep, 1000000),
+         "signOnSweep 100k quiet": functools.partial(caseSignOnSweep, 100000, False)}
+
+#Registry of generated serial numbers, brands are assigned in turn
+def benchmarkRegistry(count):
+    brands = ("LUNA", "MAKEL", "VIKO", "KOHLER")
+    return MeterRegistry([str(71234560 + _) for _ in range(count)],
+                         [brands[_ % len(brands)] for _ in range(count)],
+                         [1] * count)
+
+#Returns peak of Python allocations (bytes) while case is set up and run
+#It is measured in its own pass, tracing would slow down timed trials; process RSS would be cumulative over cases
+def measurePeakAllocated(name):
+    tracemalloc.start()
+    try:
+        operation, _, cleanup = CASES[name]()
+        try:
+            for _ in range(MEMORY_RUNS):
+                operation()
+        finally:
+            if cleanup is not None:
+                cleanup()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def percentile(sortedValues, fraction):
+    if not sortedValues:
+        return 0.0
+    return sortedValues[min(int(len(sortedValues) * fraction), len(sortedValues) - 1)]
+
+def medianAbsoluteDeviation(values):
+    median = statistics.median(values)
+    return statistics.median([abs(_ - median) for _ in values])
+
+#Runs operation for trialSeconds, every call is timed to get latency percentiles
+def runTrial(operation, trialSeconds):
+    latencies = []
+    clock = time.perf_counter_ns
+    deadline = clock() + int(trialSeconds * 1e9)
+    while True:
+        startTime = clock()
+        operation()
+        endTime = clock()
+        latencies.append(endTime - startTime)
+        if endTime >= deadline:
+            break
+    return len(latencies) / (sum(latencies) / 1e9 or 1e-9), latencies
+
+#Runs one case in repeated trials, console output of measured functions is written to os.devnull
+#Printing still costs what it costs with a log file (formatting, encoding, write call), only the terminal is left out
+def runCase(name, trials, trialSeconds):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        peakAllocated = measurePeakAllocated(name)
+        operation, bytesPerOp, cleanup = CASES[name]()
+        try:
+            # warm-up trial is not counted
+            runTrial(operation, trialSeconds / 4)
+            opsPerTrial = []
+            latencies = []
+            for _ in range(trials):
+                opsPerSec, trialLatencies = runTrial(operation, trialSeconds)
+                opsPerTrial.append(opsPerSec)
+                latencies.extend(trialLatencies)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    latencies.sort()
+    median = statistics.median(opsPerTrial)
+    return {"opsPerSec": median,
+            "opsPerSecMad": medianAbsoluteDeviation(opsPerTrial),
+            "trials": opsPerTrial,
+            "bytesPerSec": median * bytesPerOp,
+            "p50Latency": percentile(latencies, 0.50) / 1e9,
+            "p99Latency": percentile(latencies, 0.99) / 1e9,
+            "peakAllocated": peakAllocated}
+
+#Returns CPU model name of build box
+def cpuModel():
+    try:
+        with open("/proc/cpuinfo") as cpuInfo:
+            for line in cpuInfo:
+                if line.startswith("model name"):
+                    return line.partition(":")[2].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+#Results are only compared between runs of the same environment key
+def environmentKey():
+    return platform.python_implementation() + " " + ".".join(platform.python_version_tuple()[:2]) + " | " + cpuModel()
+
+def gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+def loadHistory(path):
+    if not os.path.exists(path):
+        return {"version": HISTORY_FORMAT_VERSION, "runs": []}
+    with open(path) as historyFile:
+        history = json.load(historyFile)
+    if history.get("version") != HISTORY_FORMAT_VERSION:
+        raise ValueError("unsupported benchmark history version: " + str(history.get("version")))
+    return history
+
+def saveHistory(path, history):
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "w") as historyFile:
+        json.dump(history, historyFile, indent = 1)
+    os.replace(temporaryPath, path)
+
+#Baseline of case is the median of its last BASELINE_RUNS recorded runs in the same environment
+def findBaseline(history, key, name):
+    runs = [run["results"][name] for run in history["runs"] if run["environment"] == key and name in run["results"]]
+    runs = runs[-BASELINE_RUNS:]
+    if not runs:
+        return None
+    return {"opsPerSec": statistics.median([_["opsPerSec"] for _ in runs]),
+            "opsPerSecMad": statistics.median([_["opsPerSecMad"] for _ in runs]),
+            "p99Latency": statistics.median([_["p99Latency"] for _ in runs])}
+
+#Slowdown is a regression only when it is over threshold and clearly above trial noise
+def compareResult(result, baseline, threshold):
+    if baseline is None:
+        return VERDICT_NEW, 0.0
+    change = result["opsPerSec"] / baseline["opsPerSec"] - 1.0
+    noise = NOISE_FACTOR * MAD_SCALE * (result["opsPerSecMad"] + baseline["opsPerSecMad"])
+    difference = result["opsPerSec"] - baseline["opsPerSec"]
+    if change < -threshold and -difference > noise:
+        return VERDICT_REGRESSION, change
+    if change > threshold and difference > noise:
+        return VERDICT_FASTER, change
+    return VERDICT_OK, change
+
+def formatRow(name, result, verdict, change):
+    return "{:<26} {:>14,.0f} ops/s {:>10.2f} MB/s  p99 {:>9.1f} us  peak {:>7.1f} MB  {:+7.1%}  {}".format(
+        name, result["opsPerSec"], result["bytesPerSec"] / 1e6, result["p99Latency"] * 1e6,
+        result["peakAllocated"] / 1e6, change, verdict)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Runs simulator benchmarks and checks them against stored baselines")
+    parser.add_argument("--history", default = DEFAULT_HISTORY_FILE)
+    parser.add_argument("--record", action = "store_true", help = "append results to history file")
+    parser.add_argument("--check", action = "store_true", help = "exit with 1 when a case regressed")
+    parser.add_argument("--trials", type = int, default = DEFAULT_TRIALS)
+    parser.add_argument("--trial-seconds", type = float, default = DEFAULT_TRIAL_SECONDS)
+    parser.add_argument("--threshold", type = float, default = DEFAULT_THRESHOLD)
+    parser.add_argument("--filter", default = "", help = "runs only cases containing this text")
+    args = parser.parse_args()
+
+    history = loadHistory(args.history)
+    key = environmentKey()
+    print("INFO: environment: " + key)
+
+    results = {}
+    regressions = []
+    for name in CASES:
+        if args.filter not in name:
+            continue
+        result = runCase(name, args.trials, args.trial_seconds)
+        verdict, change = compareResult(result, findBaseline(history, key, name), args.threshold)
+        results[name] = result
+        if verdict == VERDICT_REGRESSION:
+            regressions.append(name)
+        print(formatRow(name, result, verdict, change))
+
+    if args.record:
+        history["runs"].append({"commit": gitCommit(),
+                                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                "environment": key,
+                                "results": results})
+        saveHistory(args.history, history)
+        print("INFO: results recorded to " + args.history)
+
+    if regressions:
+        print("ERROR_BENCHMARK: regression in " + ", ".join(regressions))
+        if args.check:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+#Brand Registry .py file includes meter brand plugins keyed by brand code
+#Built-in brands are registered by AMRProcess.py, other brands are plugins found in plugins directory or
+#in "iec62056_simulator.brands" entry points. Plugins are imported when a meter of their brand is addressed first time
+#
+#Plugin is a module (plugins directory: <BRAND CODE>.py, entry point: name is brand code) with two functions:
+#    createReadoutMessage()                                  readout data lines, like createLunaReadoutResponse
+#    createIdentificationMessage(serialNo, baudrateInRuntime) identification line without CR LF, e.g. "/XYZ5<1>ABC"
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import importlib.util
+import os
+import threading
+
+#Constant Definitions
+BRAND_PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brands")
+BRAND_ENTRY_POINT_GROUP = "iec62056_simulator.brands"
+
+#Readout and identification functions of one brand
+class BrandPlugin:
+    __slots__ = ("code", "createReadoutMessage", "createIdentificationMessage")
+
+    def __init__(self, code, createReadoutMessage, createIdentificationMessage):
+        self.code = code
+        self.createReadoutMessage = createReadoutMessage
+        self.createIdentificationMessage = createIdentificationMessage
+
+#Global Class Objects
+brandPlugins = {}
+# not imported plugins, {brand code: function returning plugin module}
+brandSources = {}
+discovered = False
+pluginLock = threading.Lock()
+
+def registerBrand(code, createReadoutMessage, createIdentificationMessage):
+    brandPlugins[code] = BrandPlugin(code, createReadoutMessage, createIdentificationMessage)
+
+#Registers brand whose module is imported on first use, loadModule() returns the module
+def registerBrandSource(code, loadModule):
+    if code not in brandPlugins:
+        brandSources[code] = loadModule
+
+def loadPluginFile(code, path):
+    spec = importlib.util.spec_from_file_location("brand_plugin_" + code, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+#Finds plugin files and entry points, only their names are read here
+def discoverBrandPlugins(pluginDir = None):
+    global discovered
+    discovered = True
+    if pluginDir is None:
+        pluginDir = BRAND_PLUGIN_DIR
+    if os.path.isdir(pluginDir):
+        for fileName in sorted(os.listdir(pluginDir)):
+            code, extension = os.path.splitext(fileName)
+            if extension == ".py" and not code.startswith("_"):
+                path = os.path.join(pluginDir, fileName)
+                registerBrandSource(code.upper(), lambda code = code.upper(), path = path: loadPluginFile(code, path))
+
+    try:
+        from importlib.metadata import entry_points
+        entryPoints = entry_points(group = BRAND_ENTRY_POINT_GROUP)
+    except (ImportError, TypeError):
+        # Python < 3.10 has no "group" selection, plugins directory still works there
+        return
+    for entryPoint in entryPoints:
+        registerBrandSource(entryPoint.name.upper(), entryPoint.load)
+
+#Returns codes of registered and discovered brands, plugins are not imported
+def knownBrandCodes():
+    with pluginLock:
+        if not discovered:
+            discoverBrandPlugins()
+        return set(brandPlugins) | set(brandSources)
+
+#Returns True when plugin of brand code is discovered but not imported (not used yet or its import failed)
+#Readouts and identification lines built without such plugin are not cached, plugin is tried again on next use
+def isBrandPluginPending(code):
+    return code in brandSources
+
+#Returns plugin of brand code, None when brand is unknown (no brand readout is used then)
+def getBrandPlugin(code):
+    plugin = brandPlugins.get(code)
+    if plugin is not None or code is None:
+        return plugin
+
+    with pluginLock:
+        if code in brandPlugins:
+            return brandPlugins[code]
+        if not discovered:
+            discoverBrandPlugins()
+        loadModule = brandSources.get(code)
+        if loadModule is None:
+            return None
+        # source is kept until import succeeds, a failed plugin is tried again on next use instead of becoming unknown
+        try:
+            module = loadModule()
+            registerBrand(code, module.createReadoutMessage, module.createIdentificationMessage)
+        except Exception as error:
+            print("ERROR_BRAND: brand plugin " + code + " could not be loaded: " + repr(error))
+            return None
+        del brandSources[code]
+        print("INFO: brand plugin loaded: " + code)
+        return brandPlugins[code]
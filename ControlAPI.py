@@ -0,0 +1,292 @@
+#Control API .py file includes local HTTP control interface for runtime changes of meters
+#Listens on "host:port" or on a Unix socket ("unix:/path/to/socket"), requests and responses are JSON
+#Changes are applied on scheduler thread between protocol actions, running sessions are not interrupted
+#
+#GET  /sessions                                      live session state of addressed meters
+#GET  /meters/<serial>                               state of one meter
+#GET  /scheduler                                     scheduler jitter report
+#GET  /transport                                     receive buffer counters (overruns), outages of serial line, shared readout store use
+#POST /enable    {"serials": [...] or "all": true, "enable": true}
+#POST /registers {"serials": [...], "values": {"1.8.0": 123.4}} or {"serials": [...], "offsets": {...}}
+#POST /brand     {"serials": [...] or "all": true, "brand": "LUNA"}      brand is a built-in or plugin brand, "" is no brand
+#POST /templates/reload                             rebuilds readout templates and identification lines, shared readout store is not used after it
+#POST /profile   {"seconds": 30}
+#POST /memory-snapshot
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import http.server
+import json
+import os
+import socketserver
+import threading
+
+#Global Functions
+import Profiler
+from MeterRegistry import getRegistry, INVALID_DEVICE_NUMBER
+from ReadoutTemplate import clearBrandTemplates
+from SessionScheduler import getScheduler
+from AMRProcess import unknownSerialLog
+from BrandRegistry import knownBrandCodes
+
+#Constant Definitions
+UNIX_SOCKET_PREFIX = "unix:"
+COMMAND_TIMEOUT = 10.0 # seconds
+
+#Error of a control request, reported with HTTP status
+class ControlError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+#Runs function on scheduler thread and waits for its result
+#When scheduler is not running, function is called directly
+def runOnScheduler(function, *args):
+    scheduler = getScheduler()
+    if scheduler.thread is None or scheduler.thread is threading.current_thread():
+        return function(*args)
+
+    done = threading.Event()
+    result = {}
+
+    def call():
+        try:
+            result["value"] = function(*args)
+        except Exception as error:
+            result["error"] = error
+        done.set()
+
+    scheduler.callSoon(call)
+    if not done.wait(COMMAND_TIMEOUT):
+        raise ControlError(503, "scheduler did not run command in time")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+#Returns device numbers selected by request body, unknown serial numbers are reported as error
+def selectMeters(registry, body):
+    if body.get("all"):
+        return range(len(registry))
+
+    deviceNumbers = []
+    unknown = []
+    for serial in body.get("serials", []):
+        deviceNumber = registry.lookup(str(serial))
+        if deviceNumber == INVALID_DEVICE_NUMBER:
+            unknown.append(serial)
+        else:
+            deviceNumbers.append(deviceNumber)
+    if unknown:
+        raise ControlError(404, "unknown serial numbers: " + ", ".join(str(_) for _ in unknown[:20]))
+    return deviceNumbers
+
+def describeSession(session):
+    return {"deviceNumber": session.deviceNumber,
+            "state": session.state,
+            "signOnCount": session.signOnCount,
+            "readoutCount": session.readoutCount,
+            "lastActivity": session.lastActivity}
+
+def describeMeter(registry, deviceNumber):
+    session = registry.sessions.get(deviceNumber)
+    return {"serialNo": registry.serialNo[deviceNumber],
+            "brand": registry.getBrand(deviceNumber),
+            "enable": registry.isEnabled(deviceNumber),
+            "registerOffsets": registry.registerOffsets.get(deviceNumber, {}),
+            "registerValues": registry.registerValues.get(deviceNumber, {}),
+            "session": describeSession(session) if session is not None else None}
+
+#Command Functions, all of them run on scheduler thread
+def commandSessions(body):
+    import SerialComProcess
+
+    registry = getRegistry()
+    line = SerialComProcess.serialLine
+    return {"sessions": [dict(describeSession(session), serialNo = registry.serialNo[session.deviceNumber])
+                         for session in registry.sessions.values()],
+            "timedOutSignOns": line.timedOutSignOnCount if line is not None else 0,
+            "timedOutReadouts": line.timedOutReadoutCount if line is not None else 0,
+            "evictedSessions": registry.evictedSessionCount,
+            "unknownSignOns": unknownSerialLog.count}
+
+def commandMeter(serial):
+    registry = getRegistry()
+    deviceNumber = registry.lookup(serial)
+    if deviceNumber == INVALID_DEVICE_NUMBER:
+        raise ControlError(404, "unknown serial number: " + serial)
+    return describeMeter(registry, deviceNumber)
+
+def commandEnable(body):
+    registry = getRegistry()
+    deviceNumbers = selectMeters(registry, body)
+    enable = bool(body.get("enable", True))
+    for deviceNumber in deviceNumbers:
+        registry.setEnable(deviceNumber, enable)
+    return {"changed": len(deviceNumbers)}
+
+def commandRegisters(body):
+    registry = getRegistry()
+    deviceNumbers = selectMeters(registry, body)
+    values = body.get("values", {})
+    offsets = body.get("offsets", {})
+    if not isinstance(values, dict) or not isinstance(offsets, dict):
+        raise ControlError(400, "values and offsets should be objects of register code: number")
+    for deviceNumber in deviceNumbers:
+        for code, value in values.items():
+            registry.setRegisterValue(deviceNumber, code, float(value))
+        for code, offset in offsets.items():
+            registry.setRegisterOffset(deviceNumber, code, float(offset))
+    return {"changed": len(deviceNumbers)}
+
+def commandBrand(body):
+    registry = getRegistry()
+    deviceNumbers = selectMeters(registry, body)
+    brand = body.get("brand")
+    if not isinstance(brand, str):
+        raise ControlError(400, "brand name should be given")
+    # same check as meter list of AMRParams.json, empty brand selects the no brand readout
+    if brand and brand not in knownBrandCodes():
+        raise ControlError(400, "unknown brand: " + brand)
+    for deviceNumber in deviceNumbers:
+        registry.setBrand(deviceNumber, brand)
+    return {"changed": len(deviceNumbers)}
+
+def commandReloadTemplates(body):
+    import SerialComProcess
+
+    clearBrandTemplates()
+    getRegistry().clearIdentifications()
+    # frames pre-rendered from old templates are not sent any more
+    renderer = SerialComProcess.readoutRenderer
+    if hasattr(renderer, "invalidate"):
+        renderer.invalidate()
+    return {"reloaded": True}
+
+def commandProfile(body):
+    Profiler.startProfiling(float(body.get("seconds", Profiler.PROFILE_SECONDS)))
+    return {"profiling": True, "outputDir": Profiler.outputDir}
+
+def commandMemorySnapshot(body):
+    return {"path": Profiler.takeMemorySnapshot()}
+
+def commandScheduler(body):
+    return getScheduler().jitterReport()
+
+def commandTransport(body):
+    import SerialComProcess
+
+    transport = SerialComProcess.transport
+    supervisor = SerialComProcess.portSupervisor
+    result = {"name": getattr(transport, "name", None),
+              "buffered": hasattr(transport, "stats"),
+              "port": supervisor.stats() if supervisor is not None else None}
+    renderer = SerialComProcess.readoutRenderer
+    result["readoutStore"] = renderer.stats() if hasattr(renderer, "stats") else None
+    if result["buffered"]:
+        result.update(transport.stats())
+    return result
+
+#Path: (command function, runs on scheduler thread)
+GET_COMMANDS = {"/sessions": (commandSessions, True),
+                "/scheduler": (commandScheduler, False),
+                "/transport": (commandTransport, False)}
+POST_COMMANDS = {"/enable": (commandEnable, True),
+                 "/registers": (commandRegisters, True),
+                 "/brand": (commandBrand, True),
+                 "/templates/reload": (commandReloadTemplates, True),
+                 "/profile": (commandProfile, False),
+                 "/memory-snapshot": (commandMemorySnapshot, False)}
+
+#HTTP request handler of control API
+class ControlRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/meters/"):
+            self.dispatch(commandMeter, True, self.path[len("/meters/"):])
+        else:
+            self.dispatchTable(GET_COMMANDS, {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.reply(400, {"error": "request body is not valid JSON"})
+            return
+        if not isinstance(body, dict):
+            self.reply(400, {"error": "request body should be a JSON object"})
+            return
+        self.dispatchTable(POST_COMMANDS, body)
+
+    def dispatchTable(self, table, body):
+        command = table.get(self.path)
+        if command is None:
+            self.reply(404, {"error": "unknown command: " + self.path})
+            return
+        self.dispatch(command[0], command[1], body)
+
+    def dispatch(self, function, onScheduler, argument):
+        try:
+            if onScheduler:
+                result = runOnScheduler(function, argument)
+            else:
+                result = function(argument)
+        except ControlError as error:
+            self.reply(error.status, {"error": str(error)})
+            return
+        except (TypeError, ValueError) as error:
+            self.reply(400, {"error": str(error)})
+            return
+        self.reply(200, result)
+
+    def reply(self, status, result):
+        payload = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+#HTTP server on a Unix socket, client address is reported as local
+class UnixControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = socketserver.UnixStreamServer.get_request(self)
+        return request, ("local", 0)
+
+#Global Class Objects
+controlServer = None
+
+#Creates control server on "host:port" or "unix:/path" address
+def createControlServer(address):
+    if address.startswith(UNIX_SOCKET_PREFIX):
+        path = address[len(UNIX_SOCKET_PREFIX):]
+        if os.path.exists(path):
+            os.remove(path)
+        return UnixControlServer(path, ControlRequestHandler)
+
+    host, _, port = address.rpartition(":")
+    return http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), ControlRequestHandler)
+
+#Starts control API server thread
+def controlApiInit(address):
+    global controlServer
+    controlServer = createControlServer(address)
+    thread = threading.Thread(target = controlServer.serve_forever, name = "ControlAPI", daemon = True)
+    thread.start()
+    print("INFO: control API listening on " + address)
+    return controlServer
+
+#Stops control API server
+def controlApiStop():
+    global controlServer
+    if controlServer is not None:
+        controlServer.shutdown()
+        controlServer.server_close()
+        controlServer = None
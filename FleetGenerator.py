@@ -0,0 +1,149 @@
+#Fleet Generator .py file includes vectorised synthetic meter fleet generation
+#Fleets are generated as one NumPy structured array (compact meter table) and can be saved as binary file
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import argparse
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#Global Functions
+from AMRProcess import SERIAL_NO_LENGTH
+
+#Constant Definitions
+BRAND_NAMES = ("KOHLER", "MAKEL", "LUNA", "VIKO")
+DEFAULT_BRAND_MIX = (0.25, 0.25, 0.25, 0.25)
+DEFAULT_ENABLE_RATIO = 1.0
+# Dirichlet weights of T1 (day), T2 (peak), T3 (night) and T4 (mostly unused) tariff shares
+TARIFF_SHARE_WEIGHTS = (5.0, 2.0, 3.0, 0.05)
+ENERGY_MEDIAN_KWH = 15000.0
+ENERGY_SIGMA = 0.9
+REGISTER_LIMIT = 999999.999
+DEMAND_SHAPE = 2.0
+DEMAND_SCALE_KW = 1.5
+
+#Register columns written into meter registry, code: fleet field
+REGISTER_FIELDS = {"1.8.0": "energyTotal",
+                   "1.8.1": "energyT1",
+                   "1.8.2": "energyT2",
+                   "1.8.3": "energyT3",
+                   "1.8.4": "energyT4",
+                   "1.6.0": "maxDemand",
+                   "5.8.0": "reactiveInductive",
+                   "8.8.0": "reactiveCapacitive"}
+
+#Returns structured dtype of compact meter table
+def fleetDtype():
+    return numpy.dtype([("serialNo", "<u4"),
+                        ("brand", "u1"),
+                        ("enable", "u1"),
+                        ("energyTotal", "<f8"),
+                        ("energyT1", "<f8"),
+                        ("energyT2", "<f8"),
+                        ("energyT3", "<f8"),
+                        ("energyT4", "<f8"),
+                        ("maxDemand", "<f4"),
+                        ("reactiveInductive", "<f8"),
+                        ("reactiveCapacitive", "<f8")])
+
+def checkNumpy():
+    if numpy is None:
+        raise ImportError("FleetGenerator requires numpy, please install it (pip install numpy)")
+
+#Draws unique serial numbers of SERIAL_NO_LENGTH digits, duplicates are redrawn until count is reached
+def generateSerialNumbers(rng, count):
+    limit = 10 ** SERIAL_NO_LENGTH
+    if count > limit:
+        raise ValueError("there are only " + str(limit) + " serial numbers of " + str(SERIAL_NO_LENGTH) + " digits")
+
+    serials = numpy.unique(rng.integers(0, limit, size = count, dtype = numpy.uint32))
+    while len(serials) < count:
+        extra = rng.integers(0, limit, size = count - len(serials), dtype = numpy.uint32)
+        serials = numpy.unique(numpy.concatenate((serials, extra)))
+    # unique() sorts, shuffle so that brands are not ordered by serial number
+    rng.shuffle(serials)
+    return serials
+
+#Generates compact meter table of given size
+#brandMix is the probability of every name in brands, enableRatio the share of enabled meters
+def generateFleet(count, brandMix = DEFAULT_BRAND_MIX, enableRatio = DEFAULT_ENABLE_RATIO, seed = None, brands = BRAND_NAMES):
+    checkNumpy()
+    rng = numpy.random.default_rng(seed)
+    mix = numpy.asarray(brandMix, dtype = numpy.float64)
+    if len(mix) != len(brands):
+        raise ValueError("brand mix should have one probability per brand")
+
+    fleet = numpy.empty(count, dtype = fleetDtype())
+    fleet["serialNo"] = generateSerialNumbers(rng, count)
+    fleet["brand"] = rng.choice(len(brands), size = count, p = mix / mix.sum())
+    fleet["enable"] = rng.random(count) < enableRatio
+
+    total = numpy.minimum(rng.lognormal(numpy.log(ENERGY_MEDIAN_KWH), ENERGY_SIGMA, count), REGISTER_LIMIT)
+    # tariff registers are rounded to meter resolution, total is their exact sum like on a real meter
+    shares = rng.dirichlet(TARIFF_SHARE_WEIGHTS, count)
+    tariffs = numpy.round(total[:, None] * shares, 3)
+    fleet["energyT1"] = tariffs[:, 0]
+    fleet["energyT2"] = tariffs[:, 1]
+    fleet["energyT3"] = tariffs[:, 2]
+    fleet["energyT4"] = tariffs[:, 3]
+    fleet["energyTotal"] = tariffs.sum(axis = 1)
+
+    fleet["maxDemand"] = numpy.minimum(rng.gamma(DEMAND_SHAPE, DEMAND_SCALE_KW, count), 999.999)
+    fleet["reactiveInductive"] = numpy.round(total * rng.uniform(0.05, 0.30, count), 3)
+    fleet["reactiveCapacitive"] = numpy.round(total * rng.uniform(0.0, 0.08, count), 3)
+    return fleet
+
+#Saves fleet as .npy binary file, it can be memory-mapped by loadFleet
+def saveFleet(fleet, path):
+    checkNumpy()
+    numpy.save(path, fleet, allow_pickle = False)
+
+#Loads fleet binary file, memory-mapped by default
+def loadFleet(path, mmap = True):
+    checkNumpy()
+    return numpy.load(path, mmap_mode = "r" if mmap else None, allow_pickle = False)
+
+#Returns serial numbers of fleet as zero padded strings
+def fleetSerialStrings(fleet):
+    return numpy.char.zfill(fleet["serialNo"].astype("U" + str(SERIAL_NO_LENGTH)), SERIAL_NO_LENGTH).tolist()
+
+#Loads fleet into AMRParams lists and meter registry, register values become registry columns
+def applyFleet(fleet, brands = BRAND_NAMES):
+    from AMRProcess import AMRParams
+    from MeterRegistry import registryInit
+
+    AMRParams.serialNo = fleetSerialStrings(fleet)
+    AMRParams.brand = [brands[_] for _ in fleet["brand"].tolist()]
+    AMRParams.enable = fleet["enable"].tolist()
+
+    registry = registryInit()
+    for code, field in REGISTER_FIELDS.items():
+        # field views are not copied, memory-mapped fleets stay on disk
+        registry.registerColumns[code] = fleet[field]
+    return registry
+
+#Command line interface, e.g. python FleetGenerator.py 1000000 fleet.npy --enable-ratio 0.95
+def main():
+    parser = argparse.ArgumentParser(description = "Generates synthetic meter fleet binary file")
+    parser.add_argument("count", type = int)
+    parser.add_argument("output")
+    parser.add_argument("--brand-mix", type = float, nargs = len(BRAND_NAMES), default = DEFAULT_BRAND_MIX,
+                        metavar = "P", help = "probabilities of " + ", ".join(BRAND_NAMES))
+    parser.add_argument("--enable-ratio", type = float, default = DEFAULT_ENABLE_RATIO)
+    parser.add_argument("--seed", type = int, default = None)
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    fleet = generateFleet(args.count, args.brand_mix, args.enable_ratio, args.seed)
+    saveFleet(fleet, args.output)
+    print("INFO: " + str(args.count) + " meters written to " + args.output + " in " + "{:.2f}".format(time.perf_counter() - startTime) + " s")
+
+if __name__ == '__main__':
+    main()
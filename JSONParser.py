@@ -76,6 +76,15 @@ def parseAMRParamsFromJSONFile():
     AMRParams.brand = amrParamsJSON["MeterBrandName"]
     AMRParams.serialNo = amrParamsJSON["MeterSerialNumbers"]
     AMRParams.enable = amrParamsJSON["CommunicationEnable"]
+    AMRParams.clockMode = amrParamsJSON.get("ClockMode", "REAL")
+    AMRParams.clockScale = float(amrParamsJSON.get("ClockScale", 1.0))
+    AMRParams.busMode = bool(amrParamsJSON.get("BusMode", False))
+    AMRParams.fleetFile = amrParamsJSON.get("FleetFile", "")
+    AMRParams.stateFile = amrParamsJSON.get("StateFile", "")
+    AMRParams.controlAddress = amrParamsJSON.get("ControlAddress", "")
+    AMRParams.traceDir = amrParamsJSON.get("TraceDir", "")
+    AMRParams.lineRateEmulation = bool(amrParamsJSON.get("LineRateEmulation", False))
+    AMRParams.sharedReadoutStore = bool(amrParamsJSON.get("SharedReadoutStore", False))
 
     parseSerialDataBit(dataBit)
     parseSerialParity(parity)
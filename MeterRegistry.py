@@ -0,0 +1,162 @@
+#Meter Registry .py file includes hashed meter lookup and per-meter session state
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Constant Definitions
+INVALID_DEVICE_NUMBER = -1
+
+#Protocol session state of one addressed meter
+class MeterSession:
+    __slots__ = ("deviceNumber", "state", "signOnCount", "readoutCount", "lastActivity")
+
+    def __init__(self, deviceNumber):
+        self.deviceNumber = deviceNumber
+        self.state = None
+        self.signOnCount = 0
+        self.readoutCount = 0
+        self.lastActivity = 0.0
+
+    def signOn(self, state, now):
+        self.state = state
+        self.signOnCount += 1
+        self.lastActivity = now
+
+    def readoutDone(self, now):
+        self.state = None
+        self.readoutCount += 1
+        self.lastActivity = now
+
+#Meter table with serial number index
+#Meters are kept in parallel lists, device number is the list position
+class MeterRegistry:
+    def __init__(self, serialNo, brand, enable):
+        self.serialNo = list(serialNo)
+        self.brand = list(brand)
+        self.enable = list(enable)
+        self.index = {}
+        for deviceNumber, serial in enumerate(self.serialNo):
+            # first entry wins on duplicated serial numbers
+            self.index.setdefault(serial, deviceNumber)
+        self.sessions = {}
+        # sparse per-meter register offsets, {deviceNumber: {"1.8.0": 12.5}}
+        self.registerOffsets = {}
+        # sparse per-meter absolute register values, override template values and register columns
+        self.registerValues = {}
+        # meters changed since last state checkpoint
+        self.dirty = set()
+        # meters changed at runtime at all, their pre-rendered frames (shared readout store) are out of date
+        self.changed = set()
+        # columnar absolute register values of whole fleet, {"1.8.0": array indexed by device number}
+        self.registerColumns = {}
+        self.evictedSessionCount = 0
+        # encoded identification lines, {deviceNumber: {runtime baudrate: bytes}}, filled on first sign-on
+        self.identifications = {}
+
+    def __len__(self):
+        return len(self.serialNo)
+
+    #Returns device number of requested serial number or INVALID_DEVICE_NUMBER
+    def lookup(self, serial):
+        return self.index.get(serial, INVALID_DEVICE_NUMBER)
+
+    def isEnabled(self, deviceNumber):
+        return 0 <= deviceNumber < len(self.enable) and bool(self.enable[deviceNumber])
+
+    def getBrand(self, deviceNumber):
+        if 0 <= deviceNumber < len(self.brand):
+            return self.brand[deviceNumber]
+        return None
+
+    def setEnable(self, deviceNumber, enable):
+        self.enable[deviceNumber] = 1 if enable else 0
+        self.changed.add(deviceNumber)
+
+    def setBrand(self, deviceNumber, brand):
+        self.brand[deviceNumber] = brand
+        self.dropIdentification(deviceNumber)
+        self.changed.add(deviceNumber)
+
+    #Returns cached identification line of meter, createIdentification(deviceNumber, baudrate) is called on a miss
+    def getIdentification(self, deviceNumber, baudrate, createIdentification):
+        cached = self.identifications.get(deviceNumber)
+        if cached is None:
+            cached = self.identifications[deviceNumber] = {}
+        identification = cached.get(baudrate)
+        if identification is None:
+            identification = cached[baudrate] = createIdentification(deviceNumber, baudrate)
+        return identification
+
+    #Drops cached identification lines of one meter
+    def dropIdentification(self, deviceNumber):
+        self.identifications.pop(deviceNumber, None)
+
+    #Drops all cached identification lines (e.g. after identification format is changed)
+    def clearIdentifications(self):
+        self.identifications.clear()
+
+    #Sets offset added to template value of register (e.g. "1.8.0") for one meter
+    def setRegisterOffset(self, deviceNumber, code, offset):
+        self.registerOffsets.setdefault(deviceNumber, {})[code] = offset
+        self.dirty.add(deviceNumber)
+        self.changed.add(deviceNumber)
+
+    #Sets absolute value of register for one meter
+    def setRegisterValue(self, deviceNumber, code, value):
+        self.registerValues.setdefault(deviceNumber, {})[code] = value
+        self.dirty.add(deviceNumber)
+        self.changed.add(deviceNumber)
+
+    #Returns meters changed since previous call and starts a new dirty set
+    def takeDirty(self):
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    #Returns absolute register values of meter from register columns and overrides, None if there are none
+    def getRegisterValues(self, deviceNumber):
+        overrides = self.registerValues.get(deviceNumber)
+        if not self.registerColumns:
+            return overrides
+        values = {code: column[deviceNumber] for code, column in self.registerColumns.items()}
+        # column values take precedence over offsets in templates, so offsets of column registers are added here
+        offsets = self.registerOffsets.get(deviceNumber)
+        if offsets:
+            for code, offset in offsets.items():
+                if code in values:
+                    values[code] = values[code] + offset
+        if overrides:
+            values.update(overrides)
+        return values
+
+    #Returns session state of meter, sessions are created on first access
+    def getSession(self, deviceNumber):
+        session = self.sessions.get(deviceNumber)
+        if session is None:
+            session = MeterSession(deviceNumber)
+            self.sessions[deviceNumber] = session
+        return session
+
+    #Drops sessions without running protocol exchange which were idle since olderThan, returns their number
+    def evictIdleSessions(self, olderThan):
+        idle = [deviceNumber for deviceNumber, session in self.sessions.items()
+                if session.state is None and session.lastActivity < olderThan]
+        for deviceNumber in idle:
+            del self.sessions[deviceNumber]
+        self.evictedSessionCount += len(idle)
+        return len(idle)
+
+#Global Class Objects
+registry = MeterRegistry([], [], [])
+
+#Builds meter registry from user configured AMRParams lists
+def registryInit():
+    global registry
+    from AMRProcess import AMRParams
+
+    registry = MeterRegistry(AMRParams.serialNo, AMRParams.brand, AMRParams.enable)
+    return registry
+
+#Returns active meter registry
+def getRegistry():
+    return registry
@@ -0,0 +1,133 @@
+#Meter State Store .py file includes SQLite persistence of changing meter state
+#Only meters changed since last checkpoint (dirty meters) are written, in one transaction per batch
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import json
+import os
+import signal
+import sqlite3
+import threading
+import time
+
+#Global Functions
+from MeterRegistry import getRegistry, INVALID_DEVICE_NUMBER
+from SessionScheduler import getScheduler
+from SimClock import CLOCK_MODE_VIRTUAL
+
+#Constant Definitions
+CHECKPOINT_INTERVAL = 60.0 # seconds
+CHECKPOINT_BATCH_SIZE = 10000
+
+#Meter state is kept per serial number, so it survives fleet reordering
+class MeterStateStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meter_state ("
+                                "serial_no TEXT PRIMARY KEY, "
+                                "registers TEXT NOT NULL, "
+                                "updated REAL NOT NULL)")
+        self.connection.commit()
+        self.checkpointCount = 0
+        self.writtenCount = 0
+
+    #Restores persisted register state into registry, returns number of restored meters
+    def load(self, registry):
+        restored = 0
+        for serialNo, registers in self.connection.execute("SELECT serial_no, registers FROM meter_state"):
+            deviceNumber = registry.lookup(serialNo)
+            if deviceNumber == INVALID_DEVICE_NUMBER:
+                continue
+            registers = json.loads(registers)
+            if registers.get("offsets"):
+                registry.registerOffsets[deviceNumber] = registers["offsets"]
+            if registers.get("values"):
+                registry.registerValues[deviceNumber] = registers["values"]
+            restored += 1
+        registry.dirty.clear()
+        return restored
+
+    #Writes dirty meters of registry, returns number of written meters
+    def checkpoint(self, registry):
+        with self.lock:
+            dirty = registry.takeDirty()
+            if not dirty:
+                return 0
+
+            updated = time.time()
+            rows = []
+            for deviceNumber in dirty:
+                registers = {"offsets": registry.registerOffsets.get(deviceNumber, {}),
+                             "values": registry.registerValues.get(deviceNumber, {})}
+                rows.append((registry.serialNo[deviceNumber], json.dumps(registers, separators = (",", ":")), updated))
+                if len(rows) >= CHECKPOINT_BATCH_SIZE:
+                    self.writeRows(rows)
+                    rows = []
+            if rows:
+                self.writeRows(rows)
+
+            self.checkpointCount += 1
+            self.writtenCount += len(dirty)
+            return len(dirty)
+
+    def writeRows(self, rows):
+        with self.connection:
+            self.connection.executemany("INSERT INTO meter_state (serial_no, registers, updated) VALUES (?, ?, ?) "
+                                        "ON CONFLICT(serial_no) DO UPDATE SET registers = excluded.registers, updated = excluded.updated",
+                                        rows)
+
+    def close(self):
+        self.connection.close()
+
+#Global Class Objects
+stateStore = None
+
+#Checkpoints registry and schedules the next checkpoint
+def periodicCheckpoint(interval):
+    if stateStore is None:
+        return
+    stateStore.checkpoint(getRegistry())
+    getScheduler().callLater(interval, periodicCheckpoint, interval)
+
+#Virtual clock jumps straight to the next scheduled action, so checkpoints scheduled on it would run back to back
+#With virtual clock checkpoints are timed by this wall clock thread and still run on scheduler thread
+def wallClockCheckpoints(interval):
+    while stateStore is not None:
+        time.sleep(interval)
+        getScheduler().callSoon(flushStateStore)
+
+#Opens state store, restores meter state and starts periodic checkpoints
+def stateStoreInit(path, interval = CHECKPOINT_INTERVAL):
+    global stateStore
+    stateStore = MeterStateStore(path)
+    restored = stateStore.load(getRegistry())
+    print("INFO: meter state of " + str(restored) + " meters restored from " + path)
+    if getScheduler().getClock().mode == CLOCK_MODE_VIRTUAL:
+        threading.Thread(target = wallClockCheckpoints, args = (interval,), name = "Checkpoint", daemon = True).start()
+    else:
+        getScheduler().callLater(interval, periodicCheckpoint, interval)
+    return stateStore
+
+#Writes pending meter state immediately (e.g. before restart)
+def flushStateStore():
+    if stateStore is not None:
+        stateStore.checkpoint(getRegistry())
+
+#Process is stopped with SIGTERM (e.g. main.stop), pending meter state is written before it exits
+#Has to be called from main thread
+def terminateHandler(signum, frame):
+    flushStateStore()
+    # default action ends process, so exit status still shows termination by signal
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+def flushOnTerminateInit():
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, terminateHandler)
@@ -0,0 +1,151 @@
+#Profiler .py file includes on-demand profiling hooks of running simulator
+#SIGUSR1 profiles protocol threads for PROFILE_SECONDS, SIGUSR2 writes a memory snapshot diff
+#Results are written to files in output directory, nothing is measured while profiling is disabled
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import cProfile
+import os
+import signal
+import threading
+import time
+import tracemalloc
+
+#Global Functions
+from SessionScheduler import getScheduler
+
+#Constant Definitions
+PROFILE_SECONDS = 30
+PROFILE_OUTPUT_DIR = "profiles"
+MEMORY_TOP_STATS = 50
+
+#Stage Name Definitions
+STAGE_PARSE = "parse"
+STAGE_LOOKUP = "lookup"
+STAGE_RENDER = "render"
+STAGE_WRITE = "write"
+STAGE_DRAIN_WAIT = "drain-wait"
+
+#Checked by protocol loop before every profiling call, only attribute read is paid while disabled
+enabled = False
+
+outputDir = PROFILE_OUTPUT_DIR
+profileRequested = False
+stageTimes = {}
+stageLock = threading.Lock()
+threadState = threading.local()
+# idents of threads whose profile is running, profiling stays enabled until all of them are written
+activeProfiles = set()
+memorySnapshot = None
+
+#Returns file path in output directory with timestamp and tag
+def outputPath(tag, extension):
+    os.makedirs(outputDir, exist_ok = True)
+    return os.path.join(outputDir, time.strftime("%Y%m%d-%H%M%S") + "-" + tag + extension)
+
+#Marks the end of a protocol stage, time since the previous mark is accounted to given stage
+#lap(None) starts a new measurement and (de)activates cProfile on the calling thread
+def lap(stage):
+    now = time.perf_counter()
+    if stage is None:
+        syncThreadProfile()
+    else:
+        elapsed = now - getattr(threadState, "last", now)
+        with stageLock:
+            entry = stageTimes.get(stage)
+            if entry is None:
+                stageTimes[stage] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+    threadState.last = now
+
+#cProfile only hooks the thread it is enabled on, so every protocol thread switches its own profile
+def syncThreadProfile():
+    global enabled
+    profile = getattr(threadState, "profile", None)
+    if profileRequested and profile is None:
+        threadState.profile = cProfile.Profile()
+        with stageLock:
+            activeProfiles.add(threading.get_ident())
+        threadState.profile.enable()
+    elif not profileRequested and profile is not None:
+        profile.disable()
+        threadState.profile = None
+        path = outputPath("cprofile-" + str(threading.get_ident()), ".prof")
+        profile.dump_stats(path)
+        print("INFO: profile written to " + path)
+        with stageLock:
+            activeProfiles.discard(threading.get_ident())
+            if not activeProfiles and not profileRequested:
+                enabled = False
+
+#Starts cProfile and stage timers for given seconds
+def startProfiling(seconds = PROFILE_SECONDS):
+    global enabled, profileRequested
+    with stageLock:
+        stageTimes.clear()
+    profileRequested = True
+    enabled = True
+    timer = threading.Timer(seconds, stopProfiling)
+    timer.daemon = True
+    timer.start()
+    print("INFO: profiling started for " + str(seconds) + " s")
+
+#Stops profiling, thread profiles are written at their next lap(None)
+#cProfile can only be disabled on its own thread, so protocol threads keep calling lap(None) until the last
+#started profile is written, that thread disables profiling
+def stopProfiling():
+    global enabled, profileRequested
+    profileRequested = False
+    dumpStageTimes()
+    with stageLock:
+        if not activeProfiles:
+            enabled = False
+    # protocol of global line runs on scheduler thread, its profile is written now instead of at the next request
+    getScheduler().callSoon(syncThreadProfile)
+
+#Writes per stage timers (count, total, mean and max in ms) to file
+def dumpStageTimes():
+    with stageLock:
+        snapshot = sorted(stageTimes.items())
+    path = outputPath("stages", ".txt")
+    with open(path, "w") as stageFile:
+        stageFile.write("{:<12}{:>10}{:>14}{:>12}{:>12}\n".format("stage", "count", "total_ms", "mean_ms", "max_ms"))
+        for stage, (count, total, maximum) in snapshot:
+            stageFile.write("{:<12}{:>10}{:>14.3f}{:>12.3f}{:>12.3f}\n".format(stage, count, total * 1e3, total / count * 1e3, maximum * 1e3))
+    print("INFO: stage timers written to " + path)
+    return path
+
+#Takes tracemalloc snapshot and writes difference to previous one
+#First call only starts tracing and takes the baseline
+def takeMemorySnapshot():
+    global memorySnapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        memorySnapshot = tracemalloc.take_snapshot()
+        print("INFO: memory tracing started, baseline snapshot taken")
+        return None
+
+    snapshot = tracemalloc.take_snapshot()
+    path = outputPath("tracemalloc", ".txt")
+    with open(path, "w") as memoryFile:
+        for stat in snapshot.compare_to(memorySnapshot, "lineno")[:MEMORY_TOP_STATS]:
+            memoryFile.write(str(stat) + "\n")
+    memorySnapshot = snapshot
+    print("INFO: memory snapshot diff written to " + path)
+    return path
+
+#Installs signal handlers, has to be called from main thread
+def profilerInit(directory = PROFILE_OUTPUT_DIR):
+    global outputDir
+    outputDir = directory
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: startProfiling())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: takeMemorySnapshot())
@@ -0,0 +1,160 @@
+#Readout Export .py file includes offline bulk export of framed readouts of whole meter fleet
+#Meters are rendered by a process pool and written to one archive file, which can be memory-mapped:
+#
+#    header   "<8sIIQQ"   magic, format version, reserved, meter count, index offset
+#    frames               framed readouts (STX ... ETX BCC) exactly as they are sent, back to back
+#    index    "<16sQIB3x" per meter: serial number, frame offset, frame length, flags
+#
+#e.g. python ReadoutExport.py readouts.iec --fleet fleet.npy --workers 8
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import argparse
+import mmap
+import multiprocessing
+import struct
+import time
+
+#Global Functions
+from AMRProcess import createReadoutFrame
+from MeterRegistry import getRegistry
+
+#Constant Definitions
+ARCHIVE_MAGIC = b'IECRDOUT'
+ARCHIVE_VERSION = 1
+HEADER_FORMAT = struct.Struct("<8sIIQQ")
+INDEX_FORMAT = struct.Struct("<16sQIB3x")
+EXPORT_BATCH_SIZE = 2000
+
+#Index Flag Definitions
+FLAG_ENABLED = 0x01
+
+#Loads meters of export source into global registry
+#Source is (fleetFile, stateFile), empty fleet file means meters of AMRParams.json
+def loadExportSource(source):
+    fleetFile, stateFile = source
+    if fleetFile:
+        from FleetGenerator import loadFleet, applyFleet
+        registry = applyFleet(loadFleet(fleetFile))
+    else:
+        from JSONParser import parseAMRParamsFromJSONFile
+        from MeterRegistry import registryInit
+        from AMRProcess import AMRParams
+        parseAMRParamsFromJSONFile()
+        if AMRParams.fleetFile:
+            return loadExportSource((AMRParams.fleetFile, stateFile or AMRParams.stateFile))
+        registry = registryInit()
+
+    if stateFile:
+        from MeterStateStore import MeterStateStore
+        store = MeterStateStore(stateFile)
+        store.load(registry)
+        store.close()
+    return registry
+
+#Pool worker initializer, forked workers already have the registry of parent
+def exportWorkerInit(source):
+    if len(getRegistry()) == 0:
+        loadExportSource(source)
+
+#Renders frames of device numbers [start, end), returns them joined with their lengths
+def renderBatch(bounds):
+    start, end = bounds
+    registry = getRegistry()
+    frames = [createReadoutFrame(deviceNumber, registry) for deviceNumber in range(start, end)]
+    return start, b''.join(frames), [len(_) for _ in frames]
+
+#Exports every meter of registry to archive, returns (meter count, frame bytes)
+def exportReadouts(path, registry, source, workers = None, batchSize = EXPORT_BATCH_SIZE):
+    count = len(registry)
+    batches = [(start, min(start + batchSize, count)) for start in range(0, count, batchSize)]
+    index = []
+    offset = HEADER_FORMAT.size
+
+    with open(path, "wb") as archive:
+        archive.write(HEADER_FORMAT.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, count, 0))
+        with multiprocessing.Pool(workers, initializer = exportWorkerInit, initargs = (source,)) as pool:
+            # batches come back in order, so frames and index stay in device number order
+            for start, data, lengths in pool.imap(renderBatch, batches):
+                archive.write(data)
+                for deviceNumber, length in enumerate(lengths, start):
+                    flags = FLAG_ENABLED if registry.isEnabled(deviceNumber) else 0
+                    index.append(INDEX_FORMAT.pack(str(registry.serialNo[deviceNumber]).encode(), offset, length, flags))
+                    offset += length
+
+        indexOffset = offset
+        archive.write(b''.join(index))
+        archive.seek(0)
+        archive.write(HEADER_FORMAT.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, count, indexOffset))
+    return count, indexOffset - HEADER_FORMAT.size
+
+#Memory-mapped readout archive, frames are returned as memoryview slices without copying
+class ReadoutArchive:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, version, _, self.count, self.indexOffset = HEADER_FORMAT.unpack_from(self.map, 0)
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            self.close()
+            raise ValueError("not a readout archive (version " + str(ARCHIVE_VERSION) + "): " + path)
+        self.serialIndex = None
+
+    def __len__(self):
+        return self.count
+
+    #Returns (serial number, frame offset, frame length, flags) of meter
+    def entry(self, deviceNumber):
+        if not 0 <= deviceNumber < self.count:
+            raise IndexError("device number out of archive: " + str(deviceNumber))
+        serialNo, offset, length, flags = INDEX_FORMAT.unpack_from(self.map, self.indexOffset + deviceNumber * INDEX_FORMAT.size)
+        return serialNo.rstrip(b'\x00').decode(), offset, length, flags
+
+    def frame(self, deviceNumber):
+        _, offset, length, _ = self.entry(deviceNumber)
+        return self.view[offset:offset + length]
+
+    #Returns device number of serial number, serial index is built on first lookup
+    def lookup(self, serialNo):
+        if self.serialIndex is None:
+            self.serialIndex = {}
+            for deviceNumber in range(self.count):
+                self.serialIndex.setdefault(self.entry(deviceNumber)[0], deviceNumber)
+        return self.serialIndex[serialNo]
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+#Command line interface
+def main():
+    parser = argparse.ArgumentParser(description = "Exports framed readouts of all meters to a memory-mappable archive")
+    parser.add_argument("output")
+    parser.add_argument("--fleet", default = "", help = "fleet file of FleetGenerator.py (default: meters of AMRParams.json)")
+    parser.add_argument("--state", default = "", help = "meter state file, persisted register values are applied")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type = int, default = EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    source = (args.fleet, args.state)
+    registry = loadExportSource(source)
+
+    startTime = time.perf_counter()
+    count, frameBytes = exportReadouts(args.output, registry, source, args.workers, args.batch_size)
+    elapsed = time.perf_counter() - startTime
+
+    print("INFO: " + str(count) + " readouts exported to " + args.output + " in " + "{:.2f}".format(elapsed) + " s, " +
+          "{:.0f}".format(count / elapsed) + " meters/s, " + "{:.1f}".format(frameBytes / elapsed / 1e6) + " MB/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#Readout Parser .py file includes master side IEC 62056-21 readout parser used to verify sent frames
+#Bytes are fed in chunks as they arrive, every completed frame is checked (framing, data set syntax, BCC)
+#and its data set lines are returned as OBIS records
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import argparse
+import time
+
+#Constant Definitions
+STX = b'\x02'
+ETX = b'\x03'
+LINE_END = "\r\n"
+END_OF_DATA = "!" + LINE_END
+MAX_FRAME_LENGTH = 1 << 20
+
+#Calculates block check character of a whole frame
+#Bytes are folded as one big integer, so XOR runs in C instead of a Python loop per byte
+def calculateFrameBCC(data):
+    value = int.from_bytes(data, "little")
+    width = len(data)
+    while width > 1:
+        half = width // 2
+        value = (value & ((1 << (half * 8)) - 1)) ^ (value >> (half * 8))
+        width -= half
+    return value
+
+#One data set line, e.g. 1.8.0(001234.567*kWh) or 96.77.6*2(...,...)
+#values keep (value, unit) pairs of every bracket, unit is "" when it is not given
+class ObisRecord:
+    __slots__ = ("code", "values")
+
+    def __init__(self, code, values):
+        self.code = code
+        self.values = values
+
+    #Value of first bracket
+    @property
+    def value(self):
+        return self.values[0][0] if self.values else ""
+
+    @property
+    def unit(self):
+        return self.values[0][1] if self.values else ""
+
+    def __repr__(self):
+        return "ObisRecord(" + repr(self.code) + ", " + repr(self.values) + ")"
+
+#Parsed readout frame, it is valid when no error is found
+class ReadoutFrame:
+    def __init__(self, records, bcc, expectedBCC, errors, length):
+        self.records = records
+        self.bcc = bcc
+        self.expectedBCC = expectedBCC
+        self.errors = errors
+        self.length = length
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    #Returns records by OBIS code, first record wins on duplicated codes
+    def asDict(self):
+        result = {}
+        for record in self.records:
+            result.setdefault(record.code, record)
+        return result
+
+#Parses one data set line, returns record or error text
+def parseDataSetLine(line):
+    start = line.find("(")
+    if start <= 0 or not line.endswith(")"):
+        return None, "malformed data set line: " + repr(line)
+
+    values = []
+    for part in line[start + 1:-1].split(")("):
+        if "(" in part or ")" in part:
+            return None, "malformed data set line: " + repr(line)
+        value, _, unit = part.partition("*")
+        values.append((value, unit))
+    return ObisRecord(line[:start], values), None
+
+#Parses frame body (bytes between STX and ETX, ETX included) and checks its BCC
+def parseFrame(body, bcc):
+    errors = []
+    expectedBCC = calculateFrameBCC(body)
+    if bcc != expectedBCC:
+        errors.append("BCC mismatch: received " + hex(bcc) + ", calculated " + hex(expectedBCC))
+
+    # data sets are ASCII, latin-1 decoding never fails so bad bytes are reported by syntax check
+    text = body[:-1].decode("latin-1")
+    if not text.endswith(LINE_END + END_OF_DATA):
+        errors.append("frame does not end with CR LF ! CR LF before ETX")
+        text = text.rstrip("!\r\n")
+    else:
+        text = text[:-len(LINE_END + END_OF_DATA)]
+
+    records = []
+    for line in text.split(LINE_END):
+        record, error = parseDataSetLine(line)
+        if error is not None:
+            errors.append(error)
+        else:
+            records.append(record)
+    return ReadoutFrame(records, bcc, expectedBCC, errors, len(body) + 2)
+
+#Parses identification line, e.g. /LUN5<1>LUN12345678, returns (manufacturer, baudrate id, identification)
+def parseIdentification(line):
+    if isinstance(line, bytes):
+        line = line.decode("latin-1")
+    line = line.rstrip("\r\n")
+    if len(line) < 5 or line[0] != "/":
+        raise ValueError("malformed identification line: " + repr(line))
+    return line[1:4], line[4], line[5:]
+
+#Incremental readout parser, completed frames are returned by feed
+#Bytes before STX (e.g. identification line echo) are skipped and counted
+class ReadoutParser:
+    def __init__(self, maxFrameLength = MAX_FRAME_LENGTH):
+        self.buffer = bytearray()
+        self.maxFrameLength = maxFrameLength
+        # ETX is searched only in bytes which were not searched yet
+        self.searchFrom = 0
+        self.skippedBytes = 0
+        self.frameCount = 0
+        self.errorCount = 0
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(STX)
+            if start == -1:
+                self.skippedBytes += len(self.buffer)
+                self.buffer.clear()
+                self.searchFrom = 0
+                return frames
+            if start > 0:
+                self.skippedBytes += start
+                del self.buffer[:start]
+                self.searchFrom = max(self.searchFrom - start, 0)
+
+            end = self.buffer.find(ETX, max(self.searchFrom, 1))
+            if end == -1 or end + 1 >= len(self.buffer):
+                # frame (or its BCC) is not complete yet
+                self.searchFrom = len(self.buffer) if end == -1 else end
+                if len(self.buffer) > self.maxFrameLength:
+                    frames.append(self.failFrame("frame is longer than " + str(self.maxFrameLength) + " bytes"))
+                return frames
+
+            frame = parseFrame(bytes(self.buffer[1:end + 1]), self.buffer[end + 1])
+            del self.buffer[:end + 2]
+            self.searchFrom = 0
+            self.frameCount += 1
+            if not frame.valid:
+                self.errorCount += 1
+            frames.append(frame)
+
+    #Drops oversized partial frame and reports it as an invalid frame
+    def failFrame(self, error):
+        length = len(self.buffer)
+        self.buffer.clear()
+        self.searchFrom = 0
+        self.frameCount += 1
+        self.errorCount += 1
+        return ReadoutFrame([], None, None, [error], length)
+
+#Parses one complete readout (optionally preceded by identification line), raises ValueError if it is not one valid frame
+def parseReadout(data):
+    parser = ReadoutParser()
+    frames = parser.feed(data)
+    if len(frames) != 1:
+        raise ValueError("expected one readout frame, found " + str(len(frames)))
+    if not frames[0].valid:
+        raise ValueError("; ".join(frames[0].errors))
+    return frames[0]
+
+#Command line interface, verifies every frame of a captured byte stream, e.g. python ReadoutParser.py capture.bin
+def main():
+    parser = argparse.ArgumentParser(description = "Verifies IEC 62056-21 readout frames of captured byte stream")
+    parser.add_argument("capture")
+    parser.add_argument("--chunk-size", type = int, default = 4096)
+    args = parser.parse_args()
+
+    with open(args.capture, "rb") as captureFile:
+        data = captureFile.read()
+
+    readoutParser = ReadoutParser()
+    startTime = time.perf_counter()
+    for offset in range(0, len(data), args.chunk_size):
+        for frame in readoutParser.feed(data[offset:offset + args.chunk_size]):
+            for error in frame.errors:
+                print("ERROR_PARSER: frame " + str(readoutParser.frameCount) + ": " + error)
+    elapsed = time.perf_counter() - startTime
+
+    print("INFO: " + str(readoutParser.frameCount) + " frames, " + str(readoutParser.errorCount) + " invalid, " +
+          "{:.1f}".format(len(data) / elapsed / 1e6 if elapsed else 0.0) + " MB/s")
+    return 1 if readoutParser.errorCount else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+#Readout Template .py file includes shared, pre-encoded brand readout templates
+#Meters of same brand share one template, only serial number and register offsets are kept per meter
+#Register layout of a brand is compiled once: whole frame is kept as an image with fixed-width value fields at known
+#offsets, so a readout is the image copied into a buffer with changed fields overwritten in place
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import operator
+import re
+
+#Global Functions
+from ReadoutParser import calculateFrameBCC
+from BrandRegistry import isBrandPluginPending
+
+#Constant Definitions
+STX = b'\x02'
+ETX = b'\x03'
+LINE_END = b'\r\n'
+END_OF_DATA = b'!'
+SERIAL_NO_CODES = ("0.0.0", "C.1.0")
+# current energy (1.8.0, 5.8.3 ...) and max demand (1.6.0) registers are per-meter adjustable
+# billing history (*1, *2 ...) is not
+REGISTER_PATTERN = re.compile(r'^(\d+\.[68]\.\d)\((\d+)\.(\d+)(\*[^)]*)?\)(.*)$')
+# event counters (96.7.0 power failures ...) are integer registers
+COUNTER_PATTERN = re.compile(r'^(96\.7\.\d)\((\d+)\)()()()$')
+
+#Slot Type Definitions
+SLOT_SERIAL_NO = 0
+SLOT_REGISTER = 1
+
+#Calculates block check character (XOR of all bytes)
+def calculateBCC(data, bcc = 0):
+    for byte in data:
+        bcc ^= byte
+    return bcc
+
+#Splits legacy readout string to clean data lines
+#Indentation, framing characters and everything after end of data ("!") are dropped
+def normalizeReadoutLines(readoutStr):
+    lines = []
+    for line in readoutStr.splitlines():
+        line = line.strip().strip("\x02\x03").strip()
+        if line.startswith("!"):
+            break
+        if line.endswith("!"):
+            lines.append(line[:-1].rstrip())
+            break
+        if line:
+            lines.append(line)
+    return lines
+
+#Finds serial number printed in readout (0.0.0 or C.1.0 data set)
+def findTemplateSerialNo(lines):
+    for line in lines:
+        code, _, value = line.partition("(")
+        if code in SERIAL_NO_CODES:
+            return value.split(")")[0].strip()
+    return ""
+
+#Register slot of template, value is rendered with its original width and decimals
+#Fixed-width format (e.g. b'%010.3f' for 062846.236) is compiled once per slot
+class RegisterSlot:
+    __slots__ = ("code", "baseValue", "intDigits", "decimals", "width", "baseBytes", "baseBCC", "format", "modulus")
+
+    def __init__(self, code, intPart, fracPart):
+        self.code = code
+        self.intDigits = len(intPart)
+        self.decimals = len(fracPart)
+        self.width = self.intDigits + (1 + self.decimals if self.decimals else 0)
+        self.baseBytes = (intPart + "." + fracPart if fracPart else intPart).encode()
+        self.baseValue = float(self.baseBytes)
+        self.baseBCC = calculateBCC(self.baseBytes)
+        self.format = ("%0" + str(self.width) + "." + str(self.decimals) + "f").encode()
+        self.modulus = 10 ** self.intDigits
+
+    #Renders register value with offset to template value
+    def render(self, offset):
+        return self.renderValue(self.baseValue + offset)
+
+    #Renders absolute register value, overflowing counters roll over like on a real meter
+    def renderValue(self, value):
+        text = self.format % (value % self.modulus)
+        # value rounded up to modulus (e.g. 999999.9996) has one more digit
+        return text if len(text) == self.width else text[-self.width:]
+
+#Immutable readout template of one brand
+#Frame bytes are kept as static segments with slots (serial no, registers) between them
+class BrandTemplate:
+    def __init__(self, brand, readoutStr):
+        self.brand = brand
+        lines = normalizeReadoutLines(readoutStr)
+        self.serialNo = findTemplateSerialNo(lines)
+
+        segments = []
+        slots = []
+        pending = [STX]
+        for line in lines:
+            match = REGISTER_PATTERN.match(line) or COUNTER_PATTERN.match(line)
+            if match:
+                code, intPart, fracPart, unit, rest = match.groups()
+                pending.append((code + "(").encode())
+                segments.append(b''.join(pending))
+                slots.append((SLOT_REGISTER, RegisterSlot(code, intPart, fracPart)))
+                pending = [((unit or "") + ")" + rest).encode() + LINE_END]
+                continue
+
+            parts = line.split(self.serialNo) if self.serialNo else [line]
+            for part in parts[:-1]:
+                pending.append(part.encode())
+                segments.append(b''.join(pending))
+                slots.append((SLOT_SERIAL_NO, None))
+                pending = []
+            pending.append(parts[-1].encode() + LINE_END)
+
+        pending.append(END_OF_DATA + LINE_END + ETX)
+        segments.append(b''.join(pending))
+
+        self.segments = tuple(segments)
+        self.slots = tuple(slots)
+        # BCC starts after STX, static part is calculated only once
+        self.staticBCC = calculateBCC(b''.join(self.segments)[1:])
+        self.compileImage()
+
+    #Builds frame image with template values and offsets of value fields in it
+    def compileImage(self):
+        image = []
+        offset = 0
+        self.serialOffsets = []
+        # {register code: ((offset, slot), ...)}, codes may repeat in a readout
+        registerFields = {}
+        for segment, (slotType, slot) in zip(self.segments, self.slots):
+            offset += len(segment)
+            value = self.serialNo.encode() if slotType == SLOT_SERIAL_NO else slot.baseBytes
+            if slotType == SLOT_SERIAL_NO:
+                self.serialOffsets.append(offset)
+            else:
+                registerFields.setdefault(slot.code, []).append((offset, slot))
+            image.append(segment + value)
+            offset += len(value)
+        image.append(self.segments[-1])
+
+        self.image = b''.join(image)
+        self.registerFields = {code: tuple(fields) for code, fields in registerFields.items()}
+        self.serialLength = len(self.serialNo.encode())
+        self.imageBCC = calculateBCC(self.image[1:])
+        # frame is image followed by BCC
+        self.frameLength = len(self.image) + 1
+        self.compileFormat()
+
+    #Builds one bytes format of whole image, every register field is its fixed-width conversion
+    #Fields of a dynamic readout are formatted by a single % operation and cut out of the result by one itemgetter,
+    #so there is no Python code per field. Templates are not batched when they have less than two fields, when a
+    #template value does not format back to its own text or when a repeated register code has different template values
+    def compileFormat(self):
+        self.frameFormat = None
+        fields = sorted((fieldOffset, slot) for fields in self.registerFields.values() for fieldOffset, slot in fields)
+        baseValues = {}
+        for _, slot in fields:
+            if slot.renderValue(slot.baseValue) != slot.baseBytes or baseValues.setdefault(slot.code, slot.baseValue) != slot.baseValue:
+                return
+        if len(fields) < 2:
+            return
+
+        frameFormat = []
+        position = 0
+        for fieldOffset, slot in fields:
+            frameFormat.append(self.image[position:fieldOffset].replace(b'%', b'%%'))
+            frameFormat.append(slot.format)
+            position = fieldOffset + slot.width
+        frameFormat.append(self.image[position:].replace(b'%', b'%%'))
+
+        self.frameFormat = b''.join(frameFormat)
+        self.baseValues = baseValues
+        self.getFieldValues = operator.itemgetter(*(slot.code for _, slot in fields))
+        self.fieldModuli = tuple(slot.modulus for _, slot in fields)
+        self.getFieldTexts = operator.itemgetter(*(slice(fieldOffset, fieldOffset + slot.width) for fieldOffset, slot in fields))
+        self.fieldsBCC = 0
+        for _, slot in fields:
+            self.fieldsBCC ^= slot.baseBCC
+
+    #Returns True when frame of serial number fits template image, serial number is a fixed-width field there
+    def fitsImage(self, serialNo):
+        return serialNo is None or not self.serialOffsets or len(serialNo.encode()) == self.serialLength
+
+    #Writes framed readout of one meter to buffer[offset:offset + frameLength], buffer is not resized
+    #Image is copied and only the fields of given serial number and registers are formatted over it
+    def renderInto(self, buffer, offset = 0, serialNo = None, registerOffsets = None, registerValues = None):
+        if not self.fitsImage(serialNo):
+            raise ValueError("serial number " + repr(serialNo) + " does not fit " + str(self.brand) + " template")
+        with memoryview(buffer)[offset:offset + self.frameLength] as view:
+            imageLength = self.frameLength - 1
+            bcc = self.imageBCC
+            changed = registerOffsets or registerValues
+            frame = None
+            if changed and self.frameFormat is not None:
+                frame, fieldsBCC = self.formatFrame(registerOffsets or {}, registerValues or {})
+            if frame is not None:
+                view[:imageLength] = frame
+                bcc ^= fieldsBCC
+            else:
+                view[:imageLength] = self.image
+                if changed:
+                    bcc = self.overwriteFields(view, bcc, registerOffsets, registerValues)
+
+            if serialNo is not None and serialNo != self.serialNo and self.serialOffsets:
+                serialBytes = serialNo.encode()
+                for fieldOffset in self.serialOffsets:
+                    view[fieldOffset:fieldOffset + self.serialLength] = serialBytes
+                # even count of serial fields cancels out in XOR
+                if len(self.serialOffsets) % 2:
+                    bcc ^= calculateBCC(serialBytes, calculateBCC(self.serialNo.encode()))
+            view[imageLength] = bcc
+        return self.frameLength
+
+    #Formats image with every register field in one go
+    #Returns (image, BCC change of its fields), image is None when a formatted value is wider than its field
+    def formatFrame(self, registerOffsets, registerValues):
+        values = dict(self.baseValues)
+        for code, registerOffset in registerOffsets.items():
+            if code in values:
+                values[code] += registerOffset
+        values.update(registerValues)
+
+        # overflowing counters roll over like on a real meter
+        fieldValues = tuple(map(operator.mod, self.getFieldValues(values), self.fieldModuli))
+        frame = self.frameFormat % fieldValues
+        if len(frame) != len(self.image):
+            # value rounded up to modulus of its field (e.g. 999999.9996) has one more digit
+            return None, 0
+        return frame, self.fieldsBCC ^ calculateFrameBCC(b''.join(self.getFieldTexts(frame)))
+
+    #Formats changed register fields one by one over the image, returns BCC of the image with new field values
+    #Template values of overwritten fields are XORed out of BCC, new values are XORed in at once
+    def overwriteFields(self, view, bcc, registerOffsets, registerValues):
+        fields = []
+        registerFields = self.registerFields
+        if registerOffsets:
+            for code, registerOffset in registerOffsets.items():
+                if registerValues and code in registerValues:
+                    continue
+                for fieldOffset, slot in registerFields.get(code, ()):
+                    text = slot.render(registerOffset)
+                    view[fieldOffset:fieldOffset + slot.width] = text
+                    fields.append(text)
+                    bcc ^= slot.baseBCC
+        if registerValues:
+            for code, value in registerValues.items():
+                for fieldOffset, slot in registerFields.get(code, ()):
+                    text = slot.renderValue(value)
+                    view[fieldOffset:fieldOffset + slot.width] = text
+                    fields.append(text)
+                    bcc ^= slot.baseBCC
+        if fields:
+            bcc ^= calculateFrameBCC(b''.join(fields))
+        return bcc
+
+    #Yields framed readout of one meter chunk by chunk, every chunk is a static segment followed by its slot value
+    #BCC is accumulated while chunks are produced and sent as part of the last chunk
+    #registerValues (absolute values) take precedence over registerOffsets (added to template values)
+    def iterRender(self, serialNo = None, registerOffsets = None, registerValues = None):
+        serialBytes = (serialNo if serialNo is not None else self.serialNo).encode()
+        bcc = self.staticBCC
+        for segment, (slotType, slot) in zip(self.segments, self.slots):
+            if slotType == SLOT_SERIAL_NO:
+                value = serialBytes
+            elif registerValues and slot.code in registerValues:
+                value = slot.renderValue(registerValues[slot.code])
+            elif registerOffsets and slot.code in registerOffsets:
+                value = slot.render(registerOffsets[slot.code])
+            else:
+                value = slot.baseBytes
+            bcc = calculateBCC(value, bcc)
+            yield segment + value
+        yield self.segments[-1] + bytes((bcc,))
+
+    #Renders whole framed readout of one meter
+    def render(self, serialNo = None, registerOffsets = None, registerValues = None):
+        if not self.fitsImage(serialNo):
+            return b''.join(self.iterRender(serialNo, registerOffsets, registerValues))
+        buffer = bytearray(self.frameLength)
+        self.renderInto(buffer, 0, serialNo, registerOffsets, registerValues)
+        return bytes(buffer)
+
+#Global Class Objects
+templates = {}
+
+#Returns shared template of brand, templates are built on first use
+def getBrandTemplate(brand):
+    template = templates.get(brand)
+    if template is None:
+        from AMRProcess import createReadoutMessage
+
+        template = BrandTemplate(brand, createReadoutMessage(brand))
+        if not isBrandPluginPending(brand):
+            templates[brand] = template
+    return template
+
+#Drops all built templates (e.g. after readout strings are changed by user)
+def clearBrandTemplates():
+    templates.clear()
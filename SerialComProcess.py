@@ -12,35 +12,129 @@ import threading
 import time
 
 #Global Functions
-from AMRProcess import amrSerialListCheckProcess
-from AMRProcess import createStartMessageResponse
+from AMRProcess import getSerialNo
+from AMRProcess import resolveSignOn
+from AMRProcess import getIdentification
 from AMRProcess import checkAMRQueryType
-from AMRProcess import createReadoutMessage
+from AMRProcess import iterReadoutFrame
+from AMRProcess import checkReactionTime
 from AMRProcess import IEC_MAGIC_BYTES, AMR_STATE
-from SystemFunc import waitUntilEnterPressed
+from AMRProcess import READOUT_REACTION_DELAY, REACTION_TIME_MAX, READ_POLL_DELAY, PARTIAL_SEND_DELAY
+from AMRProcess import ACKNOWLEDGE_TIMEOUT, READOUT_STUCK_TIMEOUT, SESSION_RETENTION_TIME, SESSION_WATCHDOG_INTERVAL
+import SimClock
+from SimClock import CLOCK_MODE_VIRTUAL
+import Profiler
+import SessionTracer
+from Transport  import openTransport, bitsPerCharacter
+from MeterRegistry import getRegistry, INVALID_DEVICE_NUMBER
+from SessionScheduler import getScheduler
 
 #Global Class Objects
 from AMRProcess import AMRParams
 
 #Constant Definitions
 DEBUG_SERIAL_COM = 1
-INVALID_DEVICE_NUMBER = -1
+PORT_RETRY_INITIAL_DELAY = 0.5 # seconds, wall clock
+PORT_RETRY_MAX_DELAY = 30.0
+PORT_RETRY_FACTOR = 2.0
+
+transport = None
+serialLine = None
+portSupervisor = None
+readoutRenderer = None
+
+#Opens port and reopens it after failure, retries are backed off exponentially
+#Outages (from failure until port is open again) are counted with their wall clock downtime
+class PortSupervisor:
+    def __init__(self, openPort, sleep = time.sleep):
+        self.openPort = openPort
+        self.sleep = sleep
+        self.outageCount = 0
+        self.downtime = 0.0
+        self.outageStart = None
+        self.openAttempts = 0
+        self.lastError = None
+
+    def portFailed(self, error):
+        self.lastError = repr(error)
+        if self.outageStart is None:
+            self.outageStart = time.monotonic()
+            self.outageCount += 1
+
+    #Opens port, blocks until it is open or isRunning() turns false (returns None then)
+    def open(self, isRunning = lambda: True):
+        delay = PORT_RETRY_INITIAL_DELAY
+        while isRunning():
+            self.openAttempts += 1
+            try:
+                newTransport = self.openPort()
+            except OSError as error:
+                # serial.SerialException is an OSError too
+                self.portFailed(error)
+                print("ERROR_COMM: Please check Com Port! " + self.lastError + ", retrying in " + str(delay) + " s")
+                self.sleep(delay)
+                delay = min(delay * PORT_RETRY_FACTOR, PORT_RETRY_MAX_DELAY)
+                continue
+
+            if self.outageStart is not None:
+                self.downtime += time.monotonic() - self.outageStart
+                self.outageStart = None
+                print("INFO: port is open again: " + str(newTransport.name))
+            return newTransport
+        return None
+
+    #Closes failed transport of line and reopens it, sessions of line are kept
+    def recover(self, line, error):
+        global transport
+        self.portFailed(error)
+        print("ERROR_COMM: port failed: " + self.lastError)
+        try:
+            line.transport.close()
+        except OSError:
+            pass
+        newTransport = self.open(lambda: line.running)
+        if newTransport is not None:
+            line.transport = newTransport
+            transport = newTransport
+
+    def stats(self):
+        downtime = self.downtime
+        if self.outageStart is not None:
+            downtime += time.monotonic() - self.outageStart
+        return {"down": self.outageStart is not None,
+                "outageCount": self.outageCount,
+                "downtime": downtime,
+                "openAttempts": self.openAttempts,
+                "lastError": self.lastError}
+
+def openConfiguredPort():
+        return openTransport(AMRParams.comPortName,
+                             AMRParams.baudrateInStart,
+                             AMRParams.dataBit,
+                             AMRParams.parity,
+                             AMRParams.stopBit,
+                             AMRParams.lineRateEmulation)
 
 #Inits serial com port with user configured params.
+#Port name can also select a PTY (pty://), TCP (tcp://host:port) or in-memory (loop://) transport
+#Port which can not be opened is retried with backoff until it shows up
 def serialInit():
-        global serialPort 
-        try:
-                serialPort = serial.Serial(AMRParams.comPortName, 
-                                          AMRParams.baudrateInStart, 
-                                          timeout = None,
-                                          bytesize = AMRParams.dataBit,
-                                          parity = AMRParams.parity,
-                                          stopbits = AMRParams.stopBit)
-                
-                print(serialPort.name)
-        except:
-                print("ERROR_COMM: Please check Com Port!")
-                waitUntilEnterPressed()
+        global transport, portSupervisor
+        portSupervisor = PortSupervisor(openConfiguredPort)
+        transport = portSupervisor.open()
+        print(transport.name)
+
+#Uses already opened transport (e.g. loopback end of a test master) instead of serialInit
+def transportInit(newTransport):
+        global transport
+        transport = newTransport
+
+#Replaces readout rendering of global serial line, renderer(deviceNumber) returns framed readout
+def readoutRendererInit(renderer):
+        global readoutRenderer
+        readoutRenderer = renderer
+        if serialLine is not None:
+                serialLine.renderReadout = renderer
 
 #Decodes string to UTF-8 Format
 def decodeStr(inputStr):
@@ -50,64 +144,256 @@ def decodeStr(inputStr):
 def encodeStr(inputStr):
     return str.encode(inputStr)
 
+#Protocol state of one communication line (one transport, one or many meters in bus mode)
+#Requests are handled on scheduler thread, protocol delays are scheduled instead of slept
+#config is any object with AMRParams attributes (baudrateInStart, baudrateInRuntime, busMode)
+#registry None means the global meter registry, renderReadout(deviceNumber) returns framed readout bytes or an iterable of chunks
+#Abandoned sessions (no option select after sign-on, readout never finished) are reset by timeout actions
+class SerialLine:
+    def __init__(self, transport, scheduler, config = AMRParams, registry = None, renderReadout = None):
+        self.transport = transport
+        self.scheduler = scheduler
+        self.config = config
+        self.registry = registry
+        self.renderReadout = renderReadout
+        self.state = None
+        # session of the addressed meter is kept from sign-on until its readout is sent
+        self.session = None
+        self.busy = False
+        self.running = True
+        # reopens transport after port failure, lines without supervisor stop on failure
+        self.supervisor = None
+        self.timeoutAction = None
+        self.timedOutSignOnCount = 0
+        self.timedOutReadoutCount = 0
+        # sign-on timed out, option select of that session is not answered
+        self.signOnExpired = False
+        # timestamp (ns) where the next traced phase starts
+        self.traceMark = 0
+
+    def getRegistry(self):
+        return self.registry if self.registry is not None else getRegistry()
+
+    #Returns seconds the line needs to send length characters at current baudrate
+    def lineTime(self, length):
+        bits = bitsPerCharacter(self.config.dataBit, self.config.parity, self.config.stopBit)
+        return length * bits / self.transport.baudrate
+
+    #Handles one request line of master device
+    def handleRequest(self, readBuffer, requestTime):
+        if Profiler.enabled: Profiler.lap(None)
+        if SessionTracer.enabled: self.traceMark = SessionTracer.now()
+
+        if self.busy:
+            print("WARNING: request is ignored while readout is being sent")
+            return
+
+        request = decodeStr(readBuffer)
+        if request == '':
+            return
+
+        state_pre = self.state
+        self.state = checkAMRQueryType(request)
+        if Profiler.enabled: Profiler.lap(Profiler.STAGE_PARSE)
+        if SessionTracer.enabled: self.trace(SessionTracer.PHASE_PARSE, None, {"request": request.strip()})
+        if self.state == AMR_STATE.REPEAT:
+            self.state = state_pre
+
+        registry = self.getRegistry()
+        if self.state == AMR_STATE.START_PROCESS:
+            self.cancelTimeout()
+            self.session = None
+            self.signOnExpired = False
+            deviceNumber = resolveSignOn(getSerialNo(request), registry, self.config.busMode)
+            if Profiler.enabled: Profiler.lap(Profiler.STAGE_LOOKUP)
+            if SessionTracer.enabled: self.trace(SessionTracer.PHASE_LOOKUP, deviceNumber)
+            if deviceNumber != INVALID_DEVICE_NUMBER:
+                self.session = registry.getSession(deviceNumber)
+                self.session.signOn(self.state, requestTime)
+                identification = getIdentification(deviceNumber, registry, self.config.baudrateInRuntime)
+                self.transport.write(identification)
+                if Profiler.enabled: Profiler.lap(Profiler.STAGE_WRITE)
+                if SessionTracer.enabled: self.trace(SessionTracer.PHASE_IDENTIFICATION, deviceNumber)
+                # master has tr max to answer after it received whole identification line
+                self.armTimeout(self.scheduler.now() + self.lineTime(len(identification)) + ACKNOWLEDGE_TIMEOUT, self.signOnTimedOut)
+        elif self.state == AMR_STATE.READOUT_PROCESS:
+            assert(readBuffer[0] == IEC_MAGIC_BYTES.ACK or chr(readBuffer[0]) == '.')
+            self.cancelTimeout()
+
+            if self.session is None and self.config.busMode:
+                # option select is for a meter which is not simulated on this bus
+                return
+            if self.session is None and self.signOnExpired:
+                # meter returned to start state, it does not know which readout was selected
+                print("WARNING: option select after sign-on timeout is ignored")
+                return
+
+            deviceNumber = self.session.deviceNumber if self.session is not None else INVALID_DEVICE_NUMBER
+            if deviceNumber == INVALID_DEVICE_NUMBER or not registry.isEnabled(deviceNumber):
+                print("WARNING: invalid device number")
+
+            self.transport.drain()
+            self.transport.setBaud(self.config.baudrateInRuntime)
+            print(f"INFO: setting baud {self.transport.baudrate} (assuming HHD respects meter's preference)")
+            if SessionTracer.enabled: self.trace(SessionTracer.PHASE_BAUD_SWITCH, deviceNumber, {"baudrate": self.config.baudrateInRuntime})
+
+            # legal delay (<1.5s), lateness up to the end of IEC reaction window is tolerated
+            self.busy = True
+            self.scheduler.callAt(requestTime + READOUT_REACTION_DELAY, self.sendReadout, deviceNumber, requestTime,
+                                  budget = REACTION_TIME_MAX - READOUT_REACTION_DELAY)
+            self.armTimeout(requestTime + READOUT_STUCK_TIMEOUT, self.readoutTimedOut)
+        else:
+            print("ERROR_COMM: Unexpected State is occured in runtime!")
+
+    #Sends readout when reaction delay is expired
+    #Readout is written chunk by chunk while it is rendered, first data line leaves without waiting for the rest
+    def sendReadout(self, deviceNumber, requestTime):
+        checkReactionTime(self.scheduler.now() - requestTime)
+        if SessionTracer.enabled: self.trace(SessionTracer.PHASE_REACTION_DELAY, deviceNumber)
+        print("INFO: sent readout start!")
+        if Profiler.enabled: Profiler.lap(None)
+        frameLength = 0
+        try:
+            if self.renderReadout is not None:
+                readoutChunks = self.renderReadout(deviceNumber)
+            else:
+                readoutChunks = iterReadoutFrame(deviceNumber, self.getRegistry())
+            if isinstance(readoutChunks, (bytes, bytearray, memoryview)):
+                readoutChunks = (readoutChunks,)
+
+            for chunk in readoutChunks:
+                if Profiler.enabled and frameLength == 0: Profiler.lap(Profiler.STAGE_RENDER)
+                self.transport.write(chunk)
+                frameLength += len(chunk)
+        except Exception as error:
+            # port is lost (reader thread reopens it) or readout can not be rendered, master repeats the request
+            print("ERROR_COMM: readout is not sent: " + repr(error))
+            self.abortReadout()
+            return
+        if Profiler.enabled: Profiler.lap(Profiler.STAGE_WRITE)
+        if SessionTracer.enabled: self.trace(SessionTracer.PHASE_READOUT_WRITE, deviceNumber, {"bytes": frameLength})
+        # this is so dumb, but pyserial's write is actually not blocking!!!
+        # this block leaves too early, while the actuall write is still pending (esp on baud 600)
+        # and changes the baud back to 300, while still sending. SO DUMB of pyserial!
+        # implement manual delay, don't trust .out_waiting, .write_timeout, .flush()
+        bytes_per_sec = self.transport.baudrate/7
+        time_to_write = frameLength / bytes_per_sec * 2.1 # it takes longer than theory
+        self.scheduler.callLater(time_to_write, self.finishReadout, deviceNumber)
+        # long readouts at low baudrates take minutes, stuck timeout counts from the end of drain wait
+        self.armTimeout(self.scheduler.now() + time_to_write + READOUT_STUCK_TIMEOUT, self.readoutTimedOut)
+
+    #Restores start baudrate when readout is drained
+    def finishReadout(self, deviceNumber = INVALID_DEVICE_NUMBER):
+        if Profiler.enabled: Profiler.lap(Profiler.STAGE_DRAIN_WAIT)
+        if SessionTracer.enabled: self.trace(SessionTracer.PHASE_DRAIN_WAIT, deviceNumber)
+        print("INFO: sent readout done")
+        self.transport.setBaud(self.config.baudrateInStart)
+        if SessionTracer.enabled: self.trace(SessionTracer.PHASE_BAUD_RESTORE, deviceNumber, {"baudrate": self.config.baudrateInStart})
+
+        if self.session is not None:
+            self.session.readoutDone(self.scheduler.now())
+            self.session = None
+        self.busy = False
+        self.cancelTimeout()
+
+    #Traces phase from previous mark until now on track of meter
+    def trace(self, phase, deviceNumber, args = None):
+        self.traceMark = SessionTracer.getTracer(self.transport.name).phase(phase, self.traceMark or SessionTracer.now(), deviceNumber, args)
+
+    #Schedules reset of abandoned session, replaces previous timeout of line
+    #Virtual clock jumps over idle time, so a waiting master would always time out there; timeouts are not used with it
+    def armTimeout(self, deadline, action):
+        self.cancelTimeout()
+        if self.scheduler.getClock().mode != CLOCK_MODE_VIRTUAL:
+            self.timeoutAction = self.scheduler.callAt(deadline, action)
+
+    def cancelTimeout(self):
+        if self.timeoutAction is not None:
+            self.timeoutAction.cancel()
+            self.timeoutAction = None
+
+    #Master did not send option select in time, meter returns to start state
+    def signOnTimedOut(self):
+        print("WARNING: session timed out waiting for option select")
+        self.timedOutSignOnCount += 1
+        self.resetSession()
+        self.signOnExpired = True
+
+    #Readout did not finish, line is released for next master
+    def readoutTimedOut(self):
+        print("WARNING: readout did not finish, line is reset")
+        self.timedOutReadoutCount += 1
+        self.transport.setBaud(self.config.baudrateInStart)
+        self.resetSession()
+
+    #Readout failed while it was rendered or written, start baudrate is restored for next master
+    def abortReadout(self):
+        self.cancelTimeout()
+        try:
+            self.transport.setBaud(self.config.baudrateInStart)
+        except OSError as error:
+            print("ERROR_COMM: start baudrate is not restored: " + repr(error))
+        self.resetSession()
+
+    def resetSession(self):
+        self.timeoutAction = None
+        if self.session is not None:
+            self.session.state = None
+            self.session = None
+        self.state = None
+        self.busy = False
+
+#Returns serial line of global transport
+def getSerialLine():
+    global serialLine
+    if serialLine is None or serialLine.transport is not transport:
+        serialLine = SerialLine(transport, getScheduler(), renderReadout = readoutRenderer)
+        serialLine.supervisor = portSupervisor
+    return serialLine
+
+#Drops idle sessions of registry and schedules the next run
+def sessionWatchdog(interval = SESSION_WATCHDOG_INTERVAL):
+    scheduler = getScheduler()
+    evicted = getRegistry().evictIdleSessions(scheduler.now() - SESSION_RETENTION_TIME)
+    if evicted and DEBUG_SERIAL_COM:
+        print("INFO: " + str(evicted) + " idle sessions dropped")
+    scheduler.callLater(interval, sessionWatchdog, interval)
+
+#Starts periodic session watchdog of global registry, not used with virtual clock (it would run back to back)
+def sessionWatchdogInit(interval = SESSION_WATCHDOG_INTERVAL):
+    scheduler = getScheduler()
+    if scheduler.getClock().mode != CLOCK_MODE_VIRTUAL:
+        scheduler.callLater(interval, sessionWatchdog, interval)
+
 #Periodic Read Event Threads
-def readFromSerialPort ():
-    state = None
-    while True:
+#Only reads master requests, handling is passed to scheduler thread
+#Failed port is reopened by supervisor of line
+def readFromSerialPort (line = None):
+    if line is None:
+        line = getSerialLine()
+    while line.running:
         
-        readBuffer = serialPort.read_until(expected=b'\r\n')
+        try:
+            readBuffer = line.transport.read(expected=b'\r\n')
+        except Exception as error:
+            if not line.running:
+                # transport is closed by stop
+                return
+            if line.supervisor is None or not isinstance(error, OSError):
+                raise
+            line.supervisor.recover(line, error)
+            continue
         
-        if decodeStr(readBuffer) != '':
-                state_pre = state
-                state = checkAMRQueryType(decodeStr(readBuffer))
-                if state == AMR_STATE.REPEAT:
-                        state = state_pre
-
-                if state == AMR_STATE.START_PROCESS:
-                        opSuccess = amrSerialListCheckProcess(decodeStr(readBuffer))
-                        if opSuccess:
-                                writeToSerialPort(createStartMessageResponse(AMRParams.requestedSerialNo))
-                                time.sleep(0.01)
-                elif state == AMR_STATE.READOUT_PROCESS:
-                        assert(readBuffer[0] == IEC_MAGIC_BYTES.ACK or chr(readBuffer[0]) == '.')
-                        
-                        if AMRParams.deviceNumber != INVALID_DEVICE_NUMBER and AMRParams.enable[AMRParams.deviceNumber]:
-                                brand = AMRParams.brand[AMRParams.deviceNumber]
-                        else:
-                                print("WARNING: invalid device number")
-                                brand = None
-                        
-                        change_baudrate = True
-                        
-                        serialPort.flush()
-
-                        if change_baudrate:
-                                serialPort.baudrate = AMRParams.baudrateInRuntime
-                                print(f"INFO: setting baud {serialPort.baudrate} (assuming HHD respects meter's preference)")
-                                
-                        time.sleep(1.100) # legal delay (<1.5s)
-                        print("INFO: sent readout start!")
-                        writeToSerialPort(createReadoutMessage(brand))
-                        # this is so dumb, but pyserial's write is actually not blocking!!!
-                        # this block leaves too early, while the actuall write is still pending (esp on baud 600)
-                        # and changes the baud back to 300, while still sending. SO DUMB of pyserial!
-                        # implement manual delay, don't trust .out_waiting, .write_timeout, .flush()
-                        bytes_per_sec = serialPort.baudrate/7
-                        time_to_write = len(createReadoutMessage(brand)) / bytes_per_sec * 2.1 # it takes longer than theory
-                        time.sleep(time_to_write)
-                        print("INFO: sent readout done")
-                        
-                        if change_baudrate:
-                                serialPort.baudrate = AMRParams.baudrateInStart
-                                
-                        AMRParams.deviceNumber = INVALID_DEVICE_NUMBER
-                else:
-                        print("ERROR_COMM: Unexpected State is occured in runtime!")
-
-        time.sleep(0.01)
+        if readBuffer:
+            line.scheduler.callSoon(line.handleRequest, readBuffer, line.scheduler.now())
+        elif line.running:
+            line.scheduler.getClock().sleep(READ_POLL_DELAY)
 
 #Inits Read Event Thread
 def readFromSerialPortThreadInit():
+    scheduler = getScheduler()
+    if scheduler.thread is None:
+        scheduler.start()
     receiveEvent = threading.Thread(target=readFromSerialPort)
     receiveEvent.start()
 
@@ -124,8 +410,10 @@ def split_chunks(s, chunksize):
 
 #Writes data to serial port. 
 #Bulk String data manupulation is implemented
-def writeToSerialPort(sendStr):
+def writeToSerialPort(sendStr, port = None):
         partialSendSize = 2000
+        if port is None:
+                port = transport
 
         strLen = len(sendStr)
         if strLen <= partialSendSize:
@@ -141,9 +429,9 @@ def writeToSerialPort(sendStr):
                                 payload += b'\r\n'
                                 # print(f'send line: ', end='')
                         # print(payload)
-                        serialPort.write(payload)
+                        port.write(payload)
         else:
                 myList = list(split_chunks(sendStr, partialSendSize))
                 for i in range (0, len(myList)):
-                        serialPort.write(encodeStr(myList[i]))
-                        time.sleep(0.1)
+                        port.write(encodeStr(myList[i]))
+                        SimClock.sleep(PARTIAL_SEND_DELAY)
@@ -0,0 +1,144 @@
+#Session Scheduler .py file includes deadline scheduler for protocol actions of all sessions
+#Waiting sessions are only heap entries, one thread runs every due action
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import heapq
+import itertools
+import threading
+
+#Global Functions
+import SimClock
+
+#Scheduled action, cancelled entries stay in heap and are skipped when they are due
+class ScheduledAction:
+    __slots__ = ("deadline", "action", "args", "budget", "cancelled")
+
+    def __init__(self, deadline, action, args, budget):
+        self.deadline = deadline
+        self.action = action
+        self.args = args
+        self.budget = budget
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+#Heap based scheduler running on simulation clock
+#Lateness of every action is measured, actions with a budget (allowed lateness) count misses
+class SessionScheduler:
+    def __init__(self, clock = None):
+        self.clock = clock
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.executedCount = 0
+        self.jitterTotal = 0.0
+        self.jitterMax = 0.0
+        self.windowMissCount = 0
+
+    def getClock(self):
+        return self.clock if self.clock is not None else SimClock.clock
+
+    def now(self):
+        return self.getClock().now()
+
+    #Parks action until deadline (simulated seconds), budget is the allowed lateness of action
+    def callAt(self, deadline, action, *args, budget = None):
+        entry = ScheduledAction(deadline, action, args, budget)
+        with self.condition:
+            heapq.heappush(self.heap, (deadline, next(self.sequence), entry))
+            if self.heap[0][2] is entry:
+                self.condition.notify()
+        return entry
+
+    def callLater(self, delay, action, *args, budget = None):
+        return self.callAt(self.now() + delay, action, *args, budget = budget)
+
+    def callSoon(self, action, *args):
+        return self.callAt(self.now(), action, *args)
+
+    def __len__(self):
+        return len(self.heap)
+
+    #Pops next due action, returns None when nothing is due
+    def popDue(self, now):
+        with self.condition:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+            if self.heap and self.heap[0][0] <= now:
+                return heapq.heappop(self.heap)[2]
+        return None
+
+    def execute(self, entry, now):
+        lateness = now - entry.deadline
+        self.executedCount += 1
+        self.jitterTotal += lateness
+        if lateness > self.jitterMax:
+            self.jitterMax = lateness
+        if entry.budget is not None and lateness > entry.budget:
+            self.windowMissCount += 1
+        try:
+            entry.action(*entry.args)
+        except Exception as error:
+            print("ERROR_SCHEDULER: Scheduled action failed: " + repr(error))
+
+    #Runs every due action and returns the number of executed actions
+    def runPending(self):
+        executed = 0
+        while True:
+            now = self.now()
+            entry = self.popDue(now)
+            if entry is None:
+                return executed
+            self.execute(entry, now)
+            executed += 1
+
+    #Scheduler loop, waits on the clock until next deadline or a new earlier action
+    def run(self):
+        self.running = True
+        while self.running:
+            self.runPending()
+            with self.condition:
+                if not self.running:
+                    break
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                delay = self.heap[0][0] - self.now()
+                if delay > 0:
+                    self.getClock().wait(self.condition, delay)
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run, name = "SessionScheduler", daemon = True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    #Returns lateness statistics of executed actions in simulated seconds
+    def jitterReport(self):
+        count = self.executedCount
+        return {"executed": count,
+                "pending": len(self.heap),
+                "jitterMean": self.jitterTotal / count if count else 0.0,
+                "jitterMax": self.jitterMax,
+                "windowMisses": self.windowMissCount}
+
+#Global Class Objects
+scheduler = SessionScheduler()
+
+#Returns default scheduler used by serial lines
+def getScheduler():
+    return scheduler
@@ -0,0 +1,148 @@
+#Session Tracer .py file includes opt-in timeline tracing of every session phase
+#Phases are written as Chrome trace-event JSON (chrome://tracing, ui.perfetto.dev), one file per port
+#Events are queued by protocol threads and written to file by a buffered background writer
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import atexit
+import collections
+import json
+import os
+import re
+import threading
+import time
+
+#Constant Definitions
+TRACE_OUTPUT_DIR = "traces"
+WRITE_INTERVAL = 0.5 # seconds, queued events are written at least this often
+WRITE_BATCH_SIZE = 4096
+
+#Phase Name Definitions
+PHASE_PARSE = "parse"
+PHASE_LOOKUP = "sign-on lookup"
+PHASE_IDENTIFICATION = "identification write"
+PHASE_BAUD_SWITCH = "baud switch"
+PHASE_REACTION_DELAY = "reaction delay"
+PHASE_READOUT_WRITE = "readout render+write"
+PHASE_DRAIN_WAIT = "drain wait"
+PHASE_BAUD_RESTORE = "baud restore"
+
+#Checked by protocol loop before every tracing call, only attribute read is paid while disabled
+enabled = False
+
+outputDir = TRACE_OUTPUT_DIR
+tracers = {}
+tracersLock = threading.Lock()
+
+#Returns current time in nanoseconds, all trace timestamps come from this clock
+def now():
+    return time.perf_counter_ns()
+
+#Writes trace events of one port to its file on a background thread
+#File is a JSON array, it stays loadable even if the program is killed before closing it
+class TraceWriter:
+    def __init__(self, path):
+        self.path = path
+        self.events = collections.deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.file = open(path, "w")
+        self.file.write("[\n")
+        self.thread = threading.Thread(target = self.run, name = "TraceWriter " + os.path.basename(path), daemon = True)
+        self.thread.start()
+
+    def put(self, event):
+        self.events.append(event)
+        if len(self.events) >= WRITE_BATCH_SIZE:
+            with self.condition:
+                self.condition.notify()
+
+    def run(self):
+        while self.running:
+            with self.condition:
+                self.condition.wait(WRITE_INTERVAL)
+            self.writePending()
+
+    def writePending(self):
+        lines = []
+        while self.events:
+            lines.append(json.dumps(self.events.popleft(), separators = (",", ":")) + ",\n")
+        if lines:
+            self.file.write("".join(lines))
+            self.file.flush()
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.writePending()
+        # closing metadata event has no trailing comma, so the array can be terminated
+        self.file.write(json.dumps({"name": "trace_end", "ph": "M", "pid": 0, "tid": 0, "args": {}}) + "\n]\n")
+        self.file.close()
+
+#Tracer of one port, port is a trace process and every meter (device number) is a thread track in it
+class SessionTracer:
+    def __init__(self, portName, pid, writer):
+        self.portName = portName
+        self.pid = pid
+        self.writer = writer
+        self.tracks = set()
+        writer.put({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": portName}})
+
+    def track(self, deviceNumber):
+        tid = deviceNumber + 1 if deviceNumber is not None and deviceNumber >= 0 else 0
+        if tid not in self.tracks:
+            self.tracks.add(tid)
+            name = "meter " + str(deviceNumber) if tid else "line"
+            self.writer.put({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}})
+        return tid
+
+    #Adds complete event from startNs until now, returns end timestamp so that phases can be chained
+    def phase(self, name, startNs, deviceNumber = None, args = None):
+        endNs = now()
+        event = {"name": name, "ph": "X", "pid": self.pid, "tid": self.track(deviceNumber),
+                 "ts": startNs / 1000.0, "dur": (endNs - startNs) / 1000.0}
+        if args:
+            event["args"] = args
+        self.writer.put(event)
+        return endNs
+
+    def instant(self, name, deviceNumber = None, args = None):
+        event = {"name": name, "ph": "i", "s": "t", "pid": self.pid, "tid": self.track(deviceNumber), "ts": now() / 1000.0}
+        if args:
+            event["args"] = args
+        self.writer.put(event)
+
+#Returns tracer of port, trace file is created on first use
+def getTracer(portName):
+    portName = str(portName)
+    with tracersLock:
+        tracer = tracers.get(portName)
+        if tracer is None:
+            os.makedirs(outputDir, exist_ok = True)
+            fileName = time.strftime("%Y%m%d-%H%M%S") + "-" + re.sub(r"[^A-Za-z0-9_.-]+", "_", portName).strip("_") + ".json"
+            tracer = SessionTracer(portName, len(tracers) + 1, TraceWriter(os.path.join(outputDir, fileName)))
+            tracers[portName] = tracer
+        return tracer
+
+#Enables tracing of all ports, trace files are written to directory
+def tracerInit(directory = TRACE_OUTPUT_DIR):
+    global enabled, outputDir
+    outputDir = directory
+    enabled = True
+    print("INFO: session phases are traced to " + directory)
+
+#Stops tracing and completes all trace files
+def tracerStop():
+    global enabled
+    enabled = False
+    with tracersLock:
+        for tracer in tracers.values():
+            tracer.writer.close()
+        tracers.clear()
+
+atexit.register(tracerStop)
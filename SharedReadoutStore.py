@@ -0,0 +1,79 @@
+#Shared Readout Store .py file includes framed readouts of whole fleet shared by all simulator processes
+#Parent process renders every meter once into a readout archive (ReadoutExport.py format) placed on shared memory
+#(/dev/shm when it exists), worker processes memory-map the same file and send frames as memoryview slices,
+#so frames are neither rendered nor copied per worker and resident memory of a worker does not grow with fleet size
+#Meters changed at runtime (control API, register updates) are rendered live, their shared frames are out of date;
+#after templates are reloaded every meter is rendered live
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import os
+import tempfile
+
+#Global Functions
+from AMRProcess import createReadoutFrame
+from ReadoutExport import ReadoutArchive, exportReadouts
+
+#Constant Definitions
+SHARED_MEMORY_DIR = "/dev/shm"
+SHARED_STORE_PREFIX = "iec62056-readouts-"
+
+#Returns path of a new shared store file, tmpfs is preferred so that pages are not written back to disk
+def sharedStorePath():
+    directory = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else tempfile.gettempdir()
+    return os.path.join(directory, SHARED_STORE_PREFIX + str(os.getpid()) + ".iec")
+
+#Renders all meters of registry into shared store, called once by parent before workers are started
+#Returns store path, source is the export source of ReadoutExport.py for workers of rendering pool
+def buildSharedReadoutStore(registry, source = ("", ""), path = None, workers = None):
+    path = path or sharedStorePath()
+    count, frameBytes = exportReadouts(path, registry, source, workers)
+    print("INFO: " + str(count) + " readouts (" + str(frameBytes) + " bytes) rendered to shared store " + path)
+    return path
+
+def removeSharedReadoutStore(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+#Readout renderer of a worker, SerialLine calls it with device number of the addressed meter
+class SharedReadoutRenderer:
+    def __init__(self, archive, registry):
+        if len(archive) != len(registry):
+            raise ValueError("shared store has " + str(len(archive)) + " meters, registry " + str(len(registry)))
+        self.archive = archive
+        self.registry = registry
+        self.sharedCount = 0
+        self.liveCount = 0
+        # cleared when readout templates are reloaded, every frame of store is out of date then
+        self.valid = True
+
+    #Meters outside of store (e.g. no-brand readout of an unknown device number) are rendered live
+    def __call__(self, deviceNumber):
+        if not self.valid or not 0 <= deviceNumber < len(self.archive) or deviceNumber in self.registry.changed:
+            self.liveCount += 1
+            return createReadoutFrame(deviceNumber, self.registry)
+        self.sharedCount += 1
+        return self.archive.frame(deviceNumber)
+
+    #All meters are rendered live from now on
+    def invalidate(self):
+        self.valid = False
+
+    def stats(self):
+        return {"path": self.archive.file.name,
+                "valid": self.valid,
+                "meters": len(self.archive),
+                "sharedReadouts": self.sharedCount,
+                "liveReadouts": self.liveCount}
+
+    def close(self):
+        self.archive.close()
+
+#Maps shared store of parent, returns renderer serving its frames for meters of registry
+def attachSharedReadoutStore(path, registry):
+    return SharedReadoutRenderer(ReadoutArchive(path), registry)
@@ -0,0 +1,105 @@
+#Simulation Clock .py file includes time sources used by all protocol timing
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import threading
+import time
+
+#Constant Definitions
+CLOCK_MODE_REAL = "REAL"
+CLOCK_MODE_SCALED = "SCALED"
+CLOCK_MODE_VIRTUAL = "VIRTUAL"
+
+#Wall clock, protocol delays are slept as they are
+class RealClock:
+    mode = CLOCK_MODE_REAL
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    #Waits on condition (lock held by caller) until notified or timeout expires
+    def wait(self, condition, seconds):
+        condition.wait(seconds)
+
+#Wall clock running "scale" times faster than real time
+#now() reports simulated seconds, so timing rules are checked against protocol values
+class ScaledClock:
+    mode = CLOCK_MODE_SCALED
+
+    def __init__(self, scale):
+        if scale <= 0:
+            raise ValueError("clock scale should be greater than zero")
+        self.scale = float(scale)
+        self.origin = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self.origin) * self.scale
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.scale)
+
+    def wait(self, condition, seconds):
+        condition.wait(seconds / self.scale)
+
+#Fully virtual clock, sleeping only moves simulated time forward
+#Used together with an in-memory transport, no wall clock time is spent at all
+class VirtualClock:
+    mode = CLOCK_MODE_VIRTUAL
+
+    def __init__(self, start = 0.0):
+        self.current = float(start)
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.advance(seconds)
+
+    #Nothing can happen in between in virtual time, so waiting jumps straight to the deadline
+    def wait(self, condition, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        with self.lock:
+            self.current += seconds
+
+#Global Class Objects
+clock = RealClock()
+
+#Creates clock object according to user configured mode
+def createClock(mode, scale = 1.0):
+    mode = str(mode).upper()
+    if mode == CLOCK_MODE_SCALED:
+        return ScaledClock(scale)
+    elif mode == CLOCK_MODE_VIRTUAL:
+        return VirtualClock()
+    else:
+        return RealClock()
+
+#Selects the time source used by protocol timing
+def setClock(newClock):
+    global clock
+    clock = newClock
+    return clock
+
+#Selects the time source by user configured mode name
+def setClockMode(mode, scale = 1.0):
+    return setClock(createClock(mode, scale))
+
+#Returns simulated time in seconds
+def now():
+    return clock.now()
+
+#Waits for given simulated time in seconds
+def sleep(seconds):
+    clock.sleep(seconds)
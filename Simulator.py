@@ -0,0 +1,151 @@
+#Simulator .py file includes embeddable simulator object for test suites and tools
+#Runs in the calling process on its own threads, without JSON file, global state or a real port, e.g.
+#
+#    with Simulator(SimulatorConfig(serialNo = ["12345678"], brand = ["LUNA"])) as simulator:
+#        simulator.master.write(b'/?12345678!\r\n')
+#        simulator.master.read()
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import asyncio
+import threading
+
+#Global Functions
+from AMRProcess import iterReadoutFrame
+from BrandRegistry import isBrandPluginPending
+from MeterRegistry import MeterRegistry
+from ReadoutParser import parseIdentification, parseReadout
+from ReadoutTemplate import BrandTemplate, getBrandTemplate, ETX
+from SerialComProcess import SerialLine, readFromSerialPort
+from SessionScheduler import SessionScheduler
+from Transport import createLoopbackPair
+
+#Constant Definitions
+READY_TIMEOUT = 5.0 # seconds
+RESPONSE_TIMEOUT = 5.0 # seconds, wall clock
+READOUT_OPTION_SELECT = b'\x06050\r\n'
+
+#Explicit configuration of one simulator, attributes have the same names as in AMRParams
+#AMRParams itself can be given instead of this object
+class SimulatorConfig:
+    def __init__(self, serialNo = (), brand = (), enable = None, baudrateInStart = 300, baudrateInRuntime = 9600, busMode = False,
+                 dataBit = 7, parity = "E", stopBit = 1):
+        self.serialNo = list(serialNo)
+        self.brand = list(brand)
+        self.enable = list(enable) if enable is not None else [1] * len(self.serialNo)
+        self.baudrateInStart = baudrateInStart
+        self.baudrateInRuntime = baudrateInRuntime
+        self.busMode = busMode
+        # IEC 62056-21 character format (7E1), used for line time of sent bytes
+        self.dataBit = dataBit
+        self.parity = parity
+        self.stopBit = stopBit
+
+#Simulator of one communication line with its own registry, scheduler and reader thread
+#transport None creates in-memory loopback link, its master end is "master"
+#payloads is a {brand: readout string} mapping replacing built-in readouts, or a callable(deviceNumber) returning framed readout bytes or chunks
+#clock None means the global simulation clock
+class Simulator:
+    def __init__(self, config = None, transport = None, payloads = None, clock = None, registry = None):
+        self.config = config if config is not None else SimulatorConfig()
+        self.master = None
+        # loopback link is created by simulator, it is created again when a stopped simulator is started
+        self.ownsTransport = transport is None
+        if self.ownsTransport:
+            transport = self.createLoopback()
+        self.transport = transport
+        self.registry = registry if registry is not None else MeterRegistry(self.config.serialNo, self.config.brand, self.config.enable)
+        self.scheduler = SessionScheduler(clock)
+        self.templates = {}
+        self.payloads = payloads
+        self.line = None
+        self.readerThread = None
+        self.ready = threading.Event()
+        self.stopped = False
+
+    def createLoopback(self):
+        self.master, transport = createLoopbackPair()
+        transport.baudrate = self.config.baudrateInStart
+        return transport
+
+    #Returns template of brand, injected payloads take precedence over built-in readouts
+    def getTemplate(self, brand):
+        template = self.templates.get(brand)
+        if template is None:
+            if self.payloads and brand in self.payloads:
+                template = BrandTemplate(brand, self.payloads[brand])
+            else:
+                template = getBrandTemplate(brand)
+                if isBrandPluginPending(brand):
+                    # plugin could not be loaded, it is tried again on next readout
+                    return template
+            self.templates[brand] = template
+        return template
+
+    def renderReadout(self, deviceNumber):
+        if callable(self.payloads):
+            return self.payloads(deviceNumber)
+        return iterReadoutFrame(deviceNumber, self.registry, self.getTemplate)
+
+    def readLoop(self):
+        self.ready.set()
+        readFromSerialPort(self.line)
+
+    #Starts scheduler and reader threads, returns when simulator is ready to answer requests
+    #Given transport is closed by stop, a stopped simulator can only be started again on its own loopback link
+    def start(self):
+        if self.line is not None:
+            return self
+        if self.stopped:
+            if not self.ownsTransport:
+                raise RuntimeError("simulator can not be started again, its transport is closed")
+            self.transport = self.createLoopback()
+            # actions left by previous run belong to its serial line
+            self.scheduler = SessionScheduler(self.scheduler.clock)
+        self.ready.clear()
+        self.line = SerialLine(self.transport, self.scheduler, self.config, self.registry, self.renderReadout)
+        self.scheduler.start()
+        self.readerThread = threading.Thread(target = self.readLoop, name = "SimulatorReader", daemon = True)
+        self.readerThread.start()
+        if not self.ready.wait(READY_TIMEOUT):
+            raise RuntimeError("simulator reader thread did not start")
+        return self
+
+    #Stops reader and scheduler threads and closes transport, pending protocol actions are dropped
+    def stop(self):
+        if self.line is None:
+            return
+        self.line.running = False
+        self.transport.close()
+        if self.master is not None:
+            self.master.close()
+        self.readerThread.join()
+        self.scheduler.stop()
+        self.line = None
+        self.readerThread = None
+        self.stopped = True
+
+    #Reads out meter over master end of loopback link, frame is verified by ReadoutParser
+    #Raises ValueError when identification or readout frame is not valid
+    def requestReadout(self, serialNo = "", timeout = RESPONSE_TIMEOUT):
+        self.master.write(b'/?' + serialNo.encode() + b'!\r\n')
+        parseIdentification(self.master.read(timeout = timeout))
+        self.master.write(READOUT_OPTION_SELECT)
+        # BCC is written together with ETX, so it is already queued when ETX is read
+        return parseReadout(self.master.read(expected = ETX, timeout = timeout) + self.master.readAvailable())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    #Simulator still runs on its own threads, event loop is only blocked while threads are joined in executor
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.stop)
@@ -10,6 +10,9 @@ import os
 
 # Restarts the current program
 def restartProgram():
+    from MeterStateStore import flushStateStore
+    flushStateStore()
+
     python = sys.executable
     os.execl(python, python, * sys.argv)
 
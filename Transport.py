@@ -0,0 +1,602 @@
+#Transport .py file includes byte transports used by protocol layer (serial, PTY, TCP and in-memory loopback)
+__author__  = "Serbay Ozkan"
+__version__ = "1.0.0"
+__email__   = "serbay.ozkan@hotmail.com"
+__status__  = "Development"
+
+#Import Python Library Modules
+import collections
+import os
+import socket
+import threading
+import serial
+
+#Global Functions
+import SimClock
+
+#Constant Definitions
+LINE_END = b'\r\n'
+TCP_URL_PREFIX = "tcp://"
+PTY_URL_PREFIX = "pty://"
+LOOPBACK_URL = "loop://"
+RX_BUFFER_SIZE = 64 * 1024
+RX_POLL_TIMEOUT = 0.1 # seconds, RX pump checks for stop request at least this often
+PTY_DEVICE_PREFIXES = ("/dev/pts/", "/dev/ttys") # Linux, macOS pseudo terminal slaves
+TX_FIFO_SIZE = 16 # characters, burst size of paced transmitter (like a 16550 UART FIFO)
+
+#Base transport, every backend implements read, write, setBaud, drain and close
+#read returns bytes up to and including "expected" (like pyserial's read_until)
+class Transport:
+    name = ""
+    baudrate = 300
+
+    def read(self, expected = LINE_END, timeout = None):
+        raise NotImplementedError
+
+    def write(self, payload):
+        raise NotImplementedError
+
+    #Reads available bytes into writable buffer view, returns number of bytes (0 on timeout)
+    #Used by RX pump thread of RxBufferedTransport
+    def readInto(self, view, timeout):
+        raise NotImplementedError
+
+    def setBaud(self, baudrate):
+        self.baudrate = baudrate
+
+    def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+#Transport on top of a pyserial port (physical port or an existing PTY path)
+class SerialTransport(Transport):
+    def __init__(self, portName, baudrate, dataBit, parity, stopBit):
+        # timeout is set once, every change of it reconfigures the port (tcsetattr) like a baudrate change
+        self.port = serial.Serial(portName,
+                                  baudrate,
+                                  timeout = RX_POLL_TIMEOUT,
+                                  bytesize = dataBit,
+                                  parity = parity,
+                                  stopbits = stopBit)
+        self.name = self.port.name
+        # POSIX backend has a file descriptor, RX pump reads it directly into its buffer
+        self.fd = getattr(self.port, "fd", None)
+        if self.fd is not None:
+            import select
+            self.select = select.select
+
+    @property
+    def baudrate(self):
+        return self.port.baudrate
+
+    def read(self, expected = LINE_END, timeout = None):
+        self.port.timeout = timeout
+        return self.port.read_until(expected = expected)
+
+    def readInto(self, view, timeout):
+        if self.fd is None:
+            # first byte is waited with timeout, the rest is whatever kernel already holds
+            if self.port.timeout != timeout:
+                self.port.timeout = timeout
+            count = min(max(self.port.in_waiting, 1), len(view))
+            return self.port.readinto(view[:count])
+
+        ready, _, _ = self.select([self.fd], [], [], timeout)
+        if not ready:
+            return 0
+        count = os.readv(self.fd, [view])
+        if count == 0:
+            # readable without data, like pyserial's read on an unplugged USB adapter
+            raise OSError("device reports readiness to read but returned no data: " + str(self.name))
+        return count
+
+    def write(self, payload):
+        return self.port.write(payload)
+
+    def setBaud(self, baudrate):
+        self.port.baudrate = baudrate
+
+    def drain(self):
+        self.port.flush()
+
+    def close(self):
+        self.port.close()
+
+#Base for stream transports reading from a file descriptor or socket
+#Received bytes are kept in a bytearray until the expected terminator shows up
+class StreamTransport(Transport):
+    def __init__(self):
+        self.rxBuffer = bytearray()
+
+    def receive(self, timeout):
+        raise NotImplementedError
+
+    def read(self, expected = LINE_END, timeout = None):
+        while True:
+            end = self.rxBuffer.find(expected)
+            if end != -1:
+                end += len(expected)
+                line = bytes(self.rxBuffer[:end])
+                del self.rxBuffer[:end]
+                return line
+
+            data = self.receive(timeout)
+            if not data:
+                line = bytes(self.rxBuffer)
+                self.rxBuffer.clear()
+                return line
+            self.rxBuffer += data
+
+#Creates a new pseudo terminal, master devices connect to "name" (slave side)
+class PtyTransport(StreamTransport):
+    def __init__(self, baudrate):
+        import select
+        import tty
+
+        StreamTransport.__init__(self)
+        self.select = select.select
+        self.fd, self.slaveFd = os.openpty()
+        tty.setraw(self.slaveFd)
+        self.name = os.ttyname(self.slaveFd)
+        self.baudrate = baudrate
+
+    def receive(self, timeout):
+        ready, _, _ = self.select([self.fd], [], [], timeout)
+        if not ready:
+            return b''
+        return os.read(self.fd, 4096)
+
+    def readInto(self, view, timeout):
+        ready, _, _ = self.select([self.fd], [], [], timeout)
+        if not ready:
+            return 0
+        return os.readv(self.fd, [view])
+
+    def write(self, payload):
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(self.fd, view):]
+        return len(payload)
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.slaveFd)
+
+#Listens on a TCP port, one master connection is served at a time
+#Only the reading side (RX pump) accepts connections, write fails while no master is connected
+class TcpTransport(StreamTransport):
+    def __init__(self, host, port, baudrate):
+        StreamTransport.__init__(self)
+        self.server = socket.create_server((host, port))
+        self.name = TCP_URL_PREFIX + host + ":" + str(self.server.getsockname()[1])
+        self.connection = None
+        self.baudrate = baudrate
+
+    #Waits up to timeout for a master, returns its connection or None
+    def accept(self, timeout):
+        if self.connection is None:
+            self.server.settimeout(timeout)
+            try:
+                self.connection, _ = self.server.accept()
+            except socket.timeout:
+                return None
+            self.rxBuffer.clear()
+        return self.connection
+
+    def disconnect(self, connection):
+        # master closed the connection, wait for the next one
+        connection.close()
+        self.connection = None
+
+    def receive(self, timeout):
+        connection = self.accept(timeout)
+        if connection is None:
+            return b''
+        connection.settimeout(timeout)
+        try:
+            data = connection.recv(4096)
+        except socket.timeout:
+            return b''
+        if not data:
+            self.disconnect(connection)
+        return data
+
+    def readInto(self, view, timeout):
+        connection = self.accept(timeout)
+        if connection is None:
+            return 0
+        connection.settimeout(timeout)
+        try:
+            count = connection.recv_into(view)
+        except socket.timeout:
+            return 0
+        if count == 0:
+            self.disconnect(connection)
+        return count
+
+    #Never waits for a master, protocol layer runs on scheduler thread shared by every line
+    def write(self, payload):
+        connection = self.connection
+        if connection is None:
+            raise OSError("no master is connected to " + self.name)
+        connection.sendall(payload)
+        return len(payload)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.server.close()
+
+#One end of an in-memory loopback link
+#Written bytes objects are handed over to the peer as they are (zero-copy)
+class LoopbackTransport(Transport):
+    def __init__(self, name, rxQueue, txQueue):
+        self.name = name
+        self.rxQueue = rxQueue
+        self.txQueue = txQueue
+        self.peer = None
+        self.closed = False
+
+    def read(self, expected = LINE_END, timeout = None):
+        queue, condition = self.rxQueue
+        with condition:
+            while not self.closed:
+                # fast path, a single written chunk holding the whole frame is returned without copying
+                if queue and queue[0].endswith(expected) and queue[0].find(expected) == len(queue[0]) - len(expected):
+                    return queue.popleft()
+
+                data = b''.join(queue)
+                end = data.find(expected)
+                if end != -1:
+                    end += len(expected)
+                    queue.clear()
+                    if end < len(data):
+                        queue.append(data[end:])
+                    return data[:end]
+
+                if not condition.wait(timeout):
+                    queue.clear()
+                    return data
+            return b''
+
+    def readAvailable(self):
+        queue, condition = self.rxQueue
+        with condition:
+            data = b''.join(queue)
+            queue.clear()
+            return data
+
+    def write(self, payload):
+        queue, condition = self.txQueue
+        with condition:
+            queue.append(bytes(payload) if not isinstance(payload, bytes) else payload)
+            condition.notify_all()
+        return len(payload)
+
+    #Wakes up pending read, it returns empty bytes from now on
+    def close(self):
+        queue, condition = self.rxQueue
+        with condition:
+            self.closed = True
+            condition.notify_all()
+
+#Preallocated receive ring buffer, bytes are read straight into its free part (no allocation per read)
+#Positions are kept as running byte counts, their remainder by capacity is the index in buffer
+#When buffer is full, the oldest half is dropped and counted as overrun
+class RxRingBuffer:
+    def __init__(self, capacity = RX_BUFFER_SIZE):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.writeCount = 0
+        self.readCount = 0
+        # unread bytes already searched for terminator
+        self.scanned = 0
+        self.overrunCount = 0
+        self.overrunBytes = 0
+        self.maxFill = 0
+
+    def __len__(self):
+        return self.writeCount - self.readCount
+
+    #Returns contiguous free part of buffer for the next read
+    def writableView(self):
+        used = len(self)
+        if used == self.capacity:
+            dropped = self.capacity // 2
+            self.readCount += dropped
+            self.scanned = 0
+            self.overrunCount += 1
+            self.overrunBytes += dropped
+            used -= dropped
+        start = self.writeCount % self.capacity
+        return self.view[start:min(self.capacity, start + self.capacity - used)]
+
+    def commit(self, count):
+        self.writeCount += count
+        if len(self) > self.maxFill:
+            self.maxFill = len(self)
+
+    #Returns next line including expected terminator, None when it is not complete yet
+    def readLine(self, expected):
+        used = len(self)
+        position = self.find(expected, max(self.scanned - len(expected) + 1, 0), used)
+        if position == -1:
+            self.scanned = used
+            return None
+        return self.take(position + len(expected))
+
+    #Returns and consumes count unread bytes
+    def take(self, count):
+        start = self.readCount % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            data = bytes(self.view[start:end])
+        else:
+            data = b''.join((self.view[start:], self.view[:end - self.capacity]))
+        self.readCount += count
+        self.scanned = 0
+        return data
+
+    def takeAll(self):
+        return self.take(len(self))
+
+    #Finds expected in unread bytes from offset, offsets are relative to first unread byte
+    def find(self, expected, offset, used):
+        start = self.readCount % self.capacity
+        first = min(used, self.capacity - start)
+        if offset < first:
+            position = self.buffer.find(expected, start + offset, start + first)
+            if position != -1:
+                return position - start
+        if used > first:
+            # terminator may straddle the end of buffer
+            edgeStart = max(offset, first - len(expected) + 1)
+            if edgeStart < first:
+                edge = b''.join((self.view[start + edgeStart:], self.view[:min(len(expected) - 1, used - first)]))
+                position = edge.find(expected)
+                if position != -1:
+                    return edgeStart + position
+            position = self.buffer.find(expected, max(offset - first, 0), used - first)
+            if position != -1:
+                return first + position
+        return -1
+
+#Transport wrapper with a dedicated RX pump thread draining the port into a ring buffer
+#Port is read continuously, independent of how long protocol processing takes
+#Errors of the port are raised by the next read
+class RxBufferedTransport(Transport):
+    def __init__(self, inner, capacity = RX_BUFFER_SIZE):
+        self.inner = inner
+        self.name = inner.name
+        self.ring = RxRingBuffer(capacity)
+        self.condition = threading.Condition()
+        self.running = True
+        self.error = None
+        self.rxBytes = 0
+        self.thread = threading.Thread(target = self.pump, name = "RxPump " + str(self.name), daemon = True)
+        self.thread.start()
+
+    @property
+    def baudrate(self):
+        return self.inner.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self.inner.baudrate = baudrate
+
+    def pump(self):
+        while self.running:
+            with self.condition:
+                view = self.ring.writableView()
+            try:
+                count = self.inner.readInto(view, RX_POLL_TIMEOUT)
+            except Exception as error:
+                with self.condition:
+                    if self.running:
+                        self.error = error
+                    self.running = False
+                    self.condition.notify_all()
+                return
+            if count:
+                with self.condition:
+                    self.ring.commit(count)
+                    self.rxBytes += count
+                    self.condition.notify_all()
+
+    def read(self, expected = LINE_END, timeout = None):
+        with self.condition:
+            while True:
+                line = self.ring.readLine(expected)
+                if line is not None:
+                    return line
+                if self.error is not None:
+                    error, self.error = self.error, None
+                    raise error
+                if not self.running or not self.condition.wait(timeout):
+                    return self.ring.takeAll()
+
+    def write(self, payload):
+        return self.inner.write(payload)
+
+    def setBaud(self, baudrate):
+        self.inner.setBaud(baudrate)
+
+    def drain(self):
+        self.inner.drain()
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.inner.close()
+
+    #Returns receive counters, overruns are bytes dropped because protocol layer did not consume them in time
+    def stats(self):
+        with self.condition:
+            return {"rxBytes": self.rxBytes,
+                    "buffered": len(self.ring),
+                    "maxFill": self.ring.maxFill,
+                    "capacity": self.ring.capacity,
+                    "overrunCount": self.ring.overrunCount,
+                    "overrunBytes": self.ring.overrunBytes}
+
+#Returns number of bits of one character on the line (start bit, data bits, parity bit, stop bits)
+def bitsPerCharacter(dataBit, parity, stopBit):
+    return 1 + dataBit + (0 if parity in (serial.PARITY_NONE, "") else 1) + stopBit
+
+#Transport wrapper emulating line rate of a real serial port (for PTY, TCP and loopback ports, which are instant)
+#Written bytes are queued and sent by TX pump thread with token bucket pacing, one token is one character time
+#Bytes are handed over in bursts of up to TX_FIFO_SIZE characters, when the time of the last one is elapsed
+#Character time follows the current baudrate, bytes still queued when baudrate is changed are counted
+class PacedTransport(Transport):
+    def __init__(self, inner, dataBit = 8, parity = serial.PARITY_NONE, stopBit = 1, clock = None):
+        self.inner = inner
+        self.name = inner.name
+        self.bitsPerChar = bitsPerCharacter(dataBit, parity, stopBit)
+        self.clock = clock
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.pendingBytes = 0
+        self.txBytes = 0
+        self.lateBaudChangeCount = 0
+        self.lateBaudChangeBytes = 0
+        self.running = True
+        self.thread = threading.Thread(target = self.pump, name = "TxPump " + str(self.name), daemon = True)
+        self.thread.start()
+
+    @property
+    def baudrate(self):
+        return self.inner.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self.inner.baudrate = baudrate
+
+    def getClock(self):
+        return self.clock if self.clock is not None else SimClock.clock
+
+    #Seconds of one character at current baudrate
+    def characterTime(self):
+        return self.bitsPerChar / self.inner.baudrate
+
+    def pump(self):
+        clock = self.getClock()
+        tokens = 0.0
+        last = clock.now()
+        while True:
+            with self.condition:
+                if not self.queue:
+                    # idle line does not save up character times, every byte is delivered after its own
+                    while self.running and not self.queue:
+                        self.condition.wait()
+                    tokens = 0.0
+                    last = clock.now()
+                if not self.running:
+                    return
+                chunk = self.queue[0]
+
+            characterTime = self.characterTime()
+            now = clock.now()
+            tokens = min(float(TX_FIFO_SIZE), tokens + (now - last) / characterTime)
+            last = now
+            needed = min(len(chunk), TX_FIFO_SIZE)
+            if tokens < needed:
+                clock.sleep((needed - tokens) * characterTime)
+                continue
+
+            self.inner.write(chunk[:needed])
+            tokens -= needed
+            with self.condition:
+                if needed < len(chunk):
+                    self.queue[0] = chunk[needed:]
+                else:
+                    self.queue.popleft()
+                self.pendingBytes -= needed
+                self.txBytes += needed
+                if not self.pendingBytes:
+                    self.condition.notify_all()
+
+    def read(self, expected = LINE_END, timeout = None):
+        return self.inner.read(expected, timeout)
+
+    def write(self, payload):
+        with self.condition:
+            self.queue.append(bytes(payload))
+            self.pendingBytes += len(payload)
+            self.condition.notify_all()
+        return len(payload)
+
+    #Changing baudrate while bytes are queued corrupts them on a real line, such bytes are counted
+    def setBaud(self, baudrate):
+        with self.condition:
+            if self.pendingBytes and baudrate != self.inner.baudrate:
+                self.lateBaudChangeCount += 1
+                self.lateBaudChangeBytes += self.pendingBytes
+                print("WARNING: baudrate changed while " + str(self.pendingBytes) + " bytes are not sent yet")
+        self.inner.setBaud(baudrate)
+
+    #Waits until every queued byte is sent
+    def drain(self):
+        with self.condition:
+            while self.running and self.pendingBytes:
+                self.condition.wait()
+        self.inner.drain()
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.inner.close()
+
+    def stats(self):
+        with self.condition:
+            result = {"txBytes": self.txBytes,
+                      "txPending": self.pendingBytes,
+                      "bitsPerCharacter": self.bitsPerChar,
+                      "lateBaudChangeCount": self.lateBaudChangeCount,
+                      "lateBaudChangeBytes": self.lateBaudChangeBytes}
+        if hasattr(self.inner, "stats"):
+            result.update(self.inner.stats())
+        return result
+
+#Creates connected master and slave ends of an in-memory loopback link
+def createLoopbackPair(name = LOOPBACK_URL):
+    masterToSlave = (collections.deque(), threading.Condition())
+    slaveToMaster = (collections.deque(), threading.Condition())
+
+    slave = LoopbackTransport(name, masterToSlave, slaveToMaster)
+    master = LoopbackTransport(name, slaveToMaster, masterToSlave)
+    slave.peer = master
+    master.peer = slave
+    return master, slave
+
+#Returns True when port name is a pseudo terminal (e.g. socat link to /dev/pts/N), it has no UART pacing its output
+def isPseudoTerminal(portName):
+    path = os.path.realpath(portName)
+    return path.startswith(PTY_DEVICE_PREFIXES)
+
+#Opens transport according to user configured port name
+#tcp://host:port, pty:// and loop:// are handled here, anything else is a serial port
+#Port backed transports are drained by an RX pump thread, loopback needs none
+#lineRate paces PTY (created or existing), TCP and loopback output to the character time of configured baudrate and framing
+def openTransport(portName, baudrate, dataBit, parity, stopBit, lineRate = False):
+    if portName.startswith(TCP_URL_PREFIX):
+        host, _, port = portName[len(TCP_URL_PREFIX):].rpartition(":")
+        transport = RxBufferedTransport(TcpTransport(host or "127.0.0.1", int(port), baudrate))
+    elif portName.startswith(PTY_URL_PREFIX):
+        transport = RxBufferedTransport(PtyTransport(baudrate))
+    elif portName == LOOPBACK_URL:
+        _, transport = createLoopbackPair()
+        transport.baudrate = baudrate
+    else:
+        transport = RxBufferedTransport(SerialTransport(portName, baudrate, dataBit, parity, stopBit))
+        if not isPseudoTerminal(portName):
+            # physical port is paced by its own UART
+            return transport
+
+    if lineRate:
+        transport = PacedTransport(transport, dataBit, parity, stopBit)
+    return transport
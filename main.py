@@ -12,33 +12,85 @@ import sys
 from JSONParser       import parseAMRParamsFromJSONFile
 from SerialComProcess import serialInit
 from SerialComProcess import readFromSerialPortThreadInit
+from SerialComProcess import sessionWatchdogInit
 from AMRProcess       import amrInit
+from AMRProcess       import AMRParams
+from SimClock         import setClockMode
+from Profiler         import profilerInit
+from MeterStateStore  import stateStoreInit, flushOnTerminateInit
+from ControlAPI       import controlApiInit
+from SessionTracer    import tracerInit
+from SerialComProcess import readoutRendererInit
+from MeterRegistry    import getRegistry
 
-def main():
+def main(sharedReadoutStore = None):
     #Parses AMRParams.json file
     parseAMRParamsFromJSONFile()
 
+    #Selects protocol time source (real, scaled or virtual)
+    setClockMode(AMRParams.clockMode, AMRParams.clockScale)
+
+    #Inits AMR Serial List Check Operation, simulator does not start with an invalid meter list
+    #Meter list is checked before the port is opened, opening is retried until the port shows up
+    if not amrInit():
+        print("ERROR_AMR: Simulator is not started!")
+        sys.exit(1)
+
     #Inits all serial comm. layer
     serialInit()
 
-    #Inits AMR Serial List Check Operation
-    amrInit()
+    #Restores persisted meter state and starts incremental checkpoints, state is flushed on SIGTERM (stop())
+    if AMRParams.stateFile:
+        stateStoreInit(AMRParams.stateFile)
+        flushOnTerminateInit()
+
+    #Sends readouts pre-rendered by parent process from shared memory
+    if sharedReadoutStore:
+        from SharedReadoutStore import attachSharedReadoutStore
+        readoutRendererInit(attachSharedReadoutStore(sharedReadoutStore, getRegistry()))
+
+    #Starts local control API for runtime changes of meters
+    if AMRParams.controlAddress:
+        controlApiInit(AMRParams.controlAddress)
+
+    #Writes Chrome trace-event timeline of every session phase
+    if AMRParams.traceDir:
+        tracerInit(AMRParams.traceDir)
+
+    #Installs on-demand profiling signal handlers (SIGUSR1: cProfile, SIGUSR2: memory diff)
+    profilerInit()
+
+    #Drops idle meter sessions periodically
+    sessionWatchdogInit()
 
     #Calls periodically read event to handle master requests
     readFromSerialPortThreadInit()
 
 process = None
+sharedReadoutStore = None
 
 if __name__ == '__main__':
     main()
 else:
+    #Process based start/stop of the whole program, Simulator.py is the lighter in-process alternative
     from AMRProcess import createNoBrandReadoutResponse as DefaultReadoutPayload
     import multiprocessing
 
+    #Renders readouts of all meters once in this process, started processes share them ("SharedReadoutStore")
+    def sharedReadoutStoreInit():
+        global sharedReadoutStore
+        from SharedReadoutStore import buildSharedReadoutStore
+        from ReadoutExport import loadExportSource
+        parseAMRParamsFromJSONFile()
+        if AMRParams.sharedReadoutStore and not sharedReadoutStore:
+            source = ("", AMRParams.stateFile)
+            sharedReadoutStore = buildSharedReadoutStore(loadExportSource(source), source)
+
     def start():
         global process
         if not process:
-            process = multiprocessing.Process(target=main)
+            sharedReadoutStoreInit()
+            process = multiprocessing.Process(target=main, args=(sharedReadoutStore,))
 
         if not process.is_alive():
             process.start()
@@ -49,3 +101,9 @@ else:
         process.join()
         process.close() # free-up resources
         process = None
+
+        global sharedReadoutStore
+        if sharedReadoutStore:
+            from SharedReadoutStore import removeSharedReadoutStore
+            removeSharedReadoutStore(sharedReadoutStore)
+            sharedReadoutStore = None
@@ -0,0 +1,21 @@
+#Simulator modules are flat files in repository root, tests import them from there
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Waits until condition() is true, returns False when it is not true within timeout (wall clock)
+def waitUntil(condition, timeout = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+@pytest.fixture
+def waitFor():
+    return waitUntil
@@ -0,0 +1,65 @@
+#Tests of sign-on handling of AMR process
+import pytest
+
+from AMRProcess import AMR_STATE, REPORT_EXAMPLE_COUNT, checkAMRQueryType, getSerialNo, resolveSignOn, validateMeterList
+from MeterRegistry import MeterRegistry, INVALID_DEVICE_NUMBER
+
+@pytest.fixture
+def registry():
+    return MeterRegistry(["71234561", "71230002"], ["LUNA", "MAKEL"], [1, 0])
+
+@pytest.mark.parametrize("line, serialNo", [("/?71234561!\r\n", "71234561"), ("/?!\r\n", "")])
+def test_sign_on_request(line, serialNo):
+    assert checkAMRQueryType(line) == AMR_STATE.START_PROCESS
+    assert getSerialNo(line) == serialNo
+
+def test_sign_on_serial_number_with_zeros_is_not_option_select():
+    assert checkAMRQueryType("/?71230002!\r\n") == AMR_STATE.START_PROCESS
+    assert checkAMRQueryType("\x06050\r\n") == AMR_STATE.READOUT_PROCESS
+
+@pytest.mark.parametrize("busMode", [False, True])
+def test_resolve_known_meter(registry, busMode):
+    assert resolveSignOn("71234561", registry, busMode) == 0
+
+@pytest.mark.parametrize("busMode", [False, True])
+def test_resolve_unknown_meter(registry, busMode):
+    assert resolveSignOn("99999999", registry, busMode) == INVALID_DEVICE_NUMBER
+
+def test_point_to_point_sign_on_without_address_selects_first_meter(registry):
+    assert resolveSignOn("", registry, False) == 0
+    assert resolveSignOn("", MeterRegistry([], [], []), False) == INVALID_DEVICE_NUMBER
+
+def test_bus_mode_ignores_sign_on_without_address_and_disabled_meters(registry):
+    assert resolveSignOn("", registry, True) == INVALID_DEVICE_NUMBER
+    assert resolveSignOn("71230002", registry, True) == INVALID_DEVICE_NUMBER
+    assert resolveSignOn("71230002", registry, False) == 1
+
+BRAND_CODES = {"LUNA", "MAKEL"}
+
+def test_valid_meter_list():
+    report = validateMeterList(["71234561", "71234562"], ["LUNA", ""], [1, 0], knownBrands = BRAND_CODES)
+    assert report.valid
+    assert report.errorLines() == []
+
+def test_meter_list_report_has_every_problem():
+    serialNo = ["71234561", "7123456", "7123456A", "71234561", "71234564", "71234561"]
+    brand = ["LUNA", "MAKEL", "ELEKTRON", "LUNA", "ELEKTRON"]
+    report = validateMeterList(serialNo, brand, [1] * len(serialNo), knownBrands = BRAND_CODES)
+    assert not report.valid
+    assert report.listMismatches == {"MeterBrandName": 5}
+    assert report.badLengths == [1]
+    assert report.nonNumeric == [2]
+    assert report.duplicates == {"71234561": [0, 3, 5]}
+    assert report.unknownBrands == {"ELEKTRON": [2, 4]}
+    assert len(report.errorLines()) == 5
+
+def test_meter_list_report_lines_are_bounded():
+    serialNo = [str(_) for _ in range(REPORT_EXAMPLE_COUNT * 3)]
+    report = validateMeterList(serialNo, ["LUNA"] * len(serialNo), [1] * len(serialNo), knownBrands = BRAND_CODES)
+    [line] = report.errorLines()
+    assert line.endswith(", ".join(str(_) for _ in range(REPORT_EXAMPLE_COUNT)) + " ... (" + str(len(serialNo)) + " in total)")
+
+def test_duplicates_found_from_registry_index():
+    registry = MeterRegistry(["71234561", "71234562", "71234561"], ["LUNA"] * 3, [1] * 3)
+    report = validateMeterList(registry.serialNo, ["LUNA"] * 3, [1] * 3, registry.index, BRAND_CODES)
+    assert report.duplicates == {"71234561": [0, 2]}
@@ -0,0 +1,61 @@
+#Tests of brand plugin loading
+import types
+
+import pytest
+
+import BrandRegistry
+import ReadoutTemplate
+from AMRProcess import createLunaReadoutResponse
+from SimClock import VirtualClock
+from Simulator import Simulator, SimulatorConfig
+
+PLUGIN_CODE = "XYZ"
+
+#Brand plugin whose first imports fail
+class FlakyPlugin:
+    def __init__(self, failures):
+        self.failures = failures
+        self.loadCount = 0
+
+    def __call__(self):
+        self.loadCount += 1
+        if self.loadCount <= self.failures:
+            raise ImportError("plugin is not installed yet")
+        return types.SimpleNamespace(createReadoutMessage = createLunaReadoutResponse,
+                                     createIdentificationMessage = lambda serialNo, baudrate: "/XYZ5<1>XYZ" + serialNo)
+
+@pytest.fixture
+def flakyPlugin(monkeypatch):
+    monkeypatch.setattr(BrandRegistry, "discovered", True)
+    monkeypatch.setattr(BrandRegistry, "brandSources", {})
+    monkeypatch.setattr(BrandRegistry, "brandPlugins", dict(BrandRegistry.brandPlugins))
+    monkeypatch.setattr(ReadoutTemplate, "templates", {})
+    plugin = FlakyPlugin(failures = 1)
+    BrandRegistry.registerBrandSource(PLUGIN_CODE, plugin)
+    return plugin
+
+def test_plugin_is_loaded_on_first_use(flakyPlugin):
+    flakyPlugin.failures = 0
+    assert PLUGIN_CODE in BrandRegistry.knownBrandCodes()
+    assert flakyPlugin.loadCount == 0
+    assert BrandRegistry.getBrandPlugin(PLUGIN_CODE).code == PLUGIN_CODE
+    assert BrandRegistry.getBrandPlugin(PLUGIN_CODE).code == PLUGIN_CODE
+    assert flakyPlugin.loadCount == 1
+    assert not BrandRegistry.isBrandPluginPending(PLUGIN_CODE)
+
+def test_unknown_brand_has_no_plugin(flakyPlugin):
+    assert BrandRegistry.getBrandPlugin("NOPE") is None
+
+def test_failed_plugin_is_tried_again(flakyPlugin):
+    config = SimulatorConfig(["71234561"], [PLUGIN_CODE])
+    with Simulator(config, clock = VirtualClock()) as simulator:
+        # import fails, meter answers like a meter without brand
+        simulator.master.write(b'/?71234561!\r\n')
+        assert simulator.master.read(timeout = 5.0) == b'\r\n'
+        assert BrandRegistry.isBrandPluginPending(PLUGIN_CODE)
+
+        # neither identification line nor readout of failed import is kept, plugin is imported on next sign-on
+        frame = simulator.requestReadout("71234561")
+        assert flakyPlugin.loadCount == 2
+        assert frame.asDict()["0.0.0"].value == "71234561"
+        assert simulator.registry.identifications[0][config.baudrateInRuntime] == b'/XYZ5<1>XYZ71234561\r\n'
@@ -0,0 +1,77 @@
+#Tests of local control API
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import MeterRegistry as MeterRegistryModule
+from ControlAPI import createControlServer
+from MeterRegistry import MeterRegistry
+
+SERIAL_NUMBERS = ["71234561", "71234562"]
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MeterRegistry(SERIAL_NUMBERS, ["LUNA", "MAKEL"], [1, 1])
+    monkeypatch.setattr(MeterRegistryModule, "registry", registry)
+    return registry
+
+#Control server on a free local port, commands run directly on request thread (scheduler is not started)
+@pytest.fixture
+def control(registry):
+    server = createControlServer("127.0.0.1:0")
+    thread = threading.Thread(target = server.serve_forever, kwargs = {"poll_interval": 0.01}, daemon = True)
+    thread.start()
+    host, port = server.server_address
+
+    def request(path, body = None, data = None):
+        if body is not None:
+            data = json.dumps(body).encode()
+        try:
+            with urllib.request.urlopen("http://" + host + ":" + str(port) + path, data = data, timeout = 5) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+    yield request
+    server.shutdown()
+    server.server_close()
+
+def test_enable_and_meter_state(control, registry):
+    assert control("/enable", {"serials": ["71234562"], "enable": False}) == (200, {"changed": 1})
+    status, meter = control("/meters/71234562")
+    assert status == 200 and meter["enable"] is False and meter["brand"] == "MAKEL"
+    assert control("/meters/99999999")[0] == 404
+
+def test_registers_apply_to_readout_values(control, registry):
+    registry.registerColumns["1.8.0"] = [100.0, 200.0]
+    assert control("/registers", {"all": True, "offsets": {"1.8.0": 2.5}})[0] == 200
+    assert registry.getRegisterValues(1)["1.8.0"] == 202.5
+    assert control("/registers", {"serials": ["71234561"], "values": {"2.8.0": 7}})[0] == 200
+    assert registry.registerValues[0] == {"2.8.0": 7.0}
+    assert registry.changed == {0, 1}
+
+@pytest.mark.parametrize("path, body", [("/registers", {"all": True, "values": [1, 2]}),
+                                        ("/registers", {"all": True, "offsets": {"1.8.0": "x"}}),
+                                        ("/brand", {"all": True}),
+                                        ("/brand", {"all": True, "brand": "LUNAA"})])
+def test_invalid_requests_are_refused(control, registry, path, body):
+    status, reply = control(path, body)
+    assert status == 400 and "error" in reply
+    assert registry.brand == ["LUNA", "MAKEL"]
+
+def test_non_object_body_is_refused(control):
+    assert control("/enable", data = b'[1, 2]')[0] == 400
+    assert control("/enable", data = b'{')[0] == 400
+
+def test_unknown_serial_numbers_are_reported(control, registry):
+    status, reply = control("/enable", {"serials": ["71234561", "99999999"]})
+    assert status == 404 and "99999999" in reply["error"]
+
+@pytest.mark.parametrize("brand", ["VIKO", ""])
+def test_brand_change(control, registry, brand):
+    registry.getIdentification(0, 9600, lambda deviceNumber, baudrate: b'/LUN5\r\n')
+    assert control("/brand", {"serials": ["71234561"], "brand": brand}) == (200, {"changed": 1})
+    assert registry.brand[0] == brand
+    assert 0 not in registry.identifications
@@ -0,0 +1,66 @@
+#Tests of persistent meter state
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from MeterRegistry import MeterRegistry
+from MeterStateStore import MeterStateStore
+
+SERIAL_NUMBERS = ["71234561", "71234562", "71234563"]
+BRANDS = ["LUNA", "MAKEL", "VIKO"]
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def createRegistry(serialNo = SERIAL_NUMBERS):
+    return MeterRegistry(serialNo, BRANDS, [1] * len(serialNo))
+
+def test_state_round_trip(tmp_path):
+    registry = createRegistry()
+    registry.setRegisterOffset(0, "1.8.0", 12.5)
+    registry.setRegisterValue(2, "2.8.0", 99.0)
+    store = MeterStateStore(str(tmp_path / "state.db"))
+    assert store.checkpoint(registry) == 2
+    # nothing changed since last checkpoint
+    assert store.checkpoint(registry) == 0
+    store.close()
+
+    # meters are matched by serial number, not by position
+    restored = createRegistry(list(reversed(SERIAL_NUMBERS)))
+    store = MeterStateStore(str(tmp_path / "state.db"))
+    assert store.load(restored) == 2
+    store.close()
+    assert restored.registerOffsets == {2: {"1.8.0": 12.5}}
+    assert restored.registerValues == {0: {"2.8.0": 99.0}}
+    assert not restored.dirty
+
+@pytest.mark.skipif(sys.platform == "win32", reason = "terminate() does not send SIGTERM on Windows")
+def test_state_is_flushed_on_sigterm(tmp_path):
+    path = str(tmp_path / "state.db")
+    script = textwrap.dedent("""
+        import sys, time
+        import MeterRegistry
+        from MeterStateStore import stateStoreInit, flushOnTerminateInit
+        MeterRegistry.registry = MeterRegistry.MeterRegistry(["71234561"], ["LUNA"], [1])
+        stateStoreInit(sys.argv[1], interval = 3600)
+        flushOnTerminateInit()
+        MeterRegistry.registry.setRegisterValue(0, "1.8.0", 7.0)
+        print("ready", flush = True)
+        time.sleep(60)
+        """)
+    process = subprocess.Popen([sys.executable, "-c", script, path], cwd = REPOSITORY_DIR, stdout = subprocess.PIPE, text = True)
+    try:
+        assert "ready\n" in iter(process.stdout.readline, "")
+        process.terminate()
+        assert process.wait(10) == -signal.SIGTERM
+    finally:
+        process.kill()
+        process.stdout.close()
+
+    registry = createRegistry()
+    store = MeterStateStore(path)
+    assert store.load(registry) == 1
+    store.close()
+    assert registry.registerValues == {0: {"1.8.0": 7.0}}
@@ -0,0 +1,55 @@
+#Tests of port supervisor reopening a missing or failed port with backoff
+#Run from repository root: python -m pytest
+from types import SimpleNamespace
+
+import SerialComProcess
+from SerialComProcess import PortSupervisor, PORT_RETRY_INITIAL_DELAY, PORT_RETRY_MAX_DELAY
+from Transport import createLoopbackPair
+
+#Port opener failing its first calls, backoff sleeps are recorded instead of waited
+class FlakyPort:
+    def __init__(self, failures):
+        self.failures = failures
+        self.delays = []
+
+    def open(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("could not open port /dev/ttyUSB0")
+        _, transport = createLoopbackPair()
+        return transport
+
+def test_open_retries_with_capped_backoff():
+    port = FlakyPort(10)
+    supervisor = PortSupervisor(port.open, sleep = port.delays.append)
+    assert supervisor.open() is not None
+    assert port.delays[0] == PORT_RETRY_INITIAL_DELAY
+    assert port.delays[:4] == [0.5, 1.0, 2.0, 4.0]
+    assert max(port.delays) == PORT_RETRY_MAX_DELAY
+    assert port.delays[-3:] == [PORT_RETRY_MAX_DELAY] * 3
+    stats = supervisor.stats()
+    assert stats["openAttempts"] == 11
+    assert stats["outageCount"] == 1
+    assert not stats["down"]
+    assert "ttyUSB0" in stats["lastError"]
+
+def test_open_gives_up_when_stopped():
+    port = FlakyPort(5)
+    running = iter([True, True, False])
+    supervisor = PortSupervisor(port.open, sleep = port.delays.append)
+    assert supervisor.open(lambda: next(running)) is None
+    assert supervisor.stats()["down"]
+    assert supervisor.stats()["openAttempts"] == 2
+
+def test_recover_replaces_transport_of_line(monkeypatch):
+    monkeypatch.setattr(SerialComProcess, "transport", None)
+    port = FlakyPort(1)
+    supervisor = PortSupervisor(port.open, sleep = port.delays.append)
+    _, failed = createLoopbackPair()
+    line = SimpleNamespace(transport = failed, running = True)
+    supervisor.recover(line, OSError("device reports readiness to read but returned no data"))
+    assert failed.closed
+    assert line.transport is not failed and line.transport is SerialComProcess.transport
+    assert port.delays == [PORT_RETRY_INITIAL_DELAY]
+    # port failure and the failed reopen after it are one outage
+    assert supervisor.stats()["outageCount"] == 1
@@ -0,0 +1,46 @@
+#Tests of master-side readout parser
+#Run from repository root: python -m pytest
+import random
+
+import pytest
+
+from AMRProcess import createReadoutFrame
+from MeterRegistry import MeterRegistry
+from ReadoutParser import ReadoutParser, calculateFrameBCC, parseIdentification, parseReadout
+from ReadoutTemplate import calculateBCC
+
+BRANDS = ("LUNA", "MAKEL", "VIKO", "KOHLER")
+SERIAL_NUMBERS = ("71234561", "71234562", "71234563", "71234564")
+
+@pytest.fixture
+def registry():
+    return MeterRegistry(SERIAL_NUMBERS, BRANDS, [1] * len(BRANDS))
+
+#Data set line carrying serial number of meter, built-in readouts print it in 0.0.0 or C.1.0
+def serialRecord(frame):
+    records = frame.asDict()
+    return records.get("0.0.0") or records.get("C.1.0")
+
+def test_parser_streams_frames_split_at_every_byte(registry):
+    data = b''.join(createReadoutFrame(_, registry) for _ in range(len(BRANDS)))
+    parser = ReadoutParser()
+    frames = []
+    for index in range(len(data)):
+        frames.extend(parser.feed(data[index:index + 1]))
+    assert [serialRecord(_).value for _ in frames] == list(SERIAL_NUMBERS)
+    assert parser.errorCount == 0
+
+def test_parser_reports_bcc_mismatch(registry):
+    frame = bytearray(createReadoutFrame(0, registry))
+    frame[-1] ^= 0x01
+    with pytest.raises(ValueError, match = "BCC mismatch"):
+        parseReadout(bytes(frame))
+
+def test_frame_bcc_fold_matches_byte_loop():
+    rng = random.Random(1)
+    for length in (1, 2, 3, 7, 8, 9, 255, 4096):
+        data = bytes(rng.randrange(256) for _ in range(length))
+        assert calculateFrameBCC(data) == calculateBCC(data)
+
+def test_identification_line():
+    assert parseIdentification(b'/LUN5<1>LUN12345678\r\n') == ("LUN", "5", "<1>LUN12345678")
@@ -0,0 +1,80 @@
+#Tests of precompiled brand readout templates
+import random
+
+import pytest
+
+from AMRProcess import createReadoutFrame, iterReadoutFrame
+from MeterRegistry import MeterRegistry
+from ReadoutParser import parseReadout
+from ReadoutTemplate import BrandTemplate, getBrandTemplate
+
+BRANDS = ("LUNA", "MAKEL", "VIKO", "KOHLER")
+SERIAL_NUMBERS = ("71234561", "71234562", "71234563", "71234564")
+
+@pytest.fixture
+def registry():
+    return MeterRegistry(SERIAL_NUMBERS, BRANDS, [1] * len(BRANDS))
+
+def renderBoth(template, serialNo = None, registerOffsets = None, registerValues = None):
+    return (template.render(serialNo, registerOffsets, registerValues),
+            b''.join(template.iterRender(serialNo, registerOffsets, registerValues)))
+
+@pytest.mark.parametrize("brand", BRANDS + (None,))
+def test_render_matches_iter_render(brand):
+    template = getBrandTemplate(brand)
+    assert template.frameFormat is not None
+    codes = sorted(template.registerFields)
+    rng = random.Random(brand)
+    for _ in range(50):
+        registerOffsets = {code: rng.uniform(-100, 1e6) for code in rng.sample(codes, rng.randrange(len(codes) + 1))}
+        registerValues = {code: rng.uniform(-1e3, 1e7) for code in rng.sample(codes, rng.randrange(len(codes) + 1))}
+        for serialNo in (None, "71234560", "123"):
+            rendered, expected = renderBoth(template, serialNo, registerOffsets, registerValues)
+            assert rendered == expected
+
+@pytest.mark.parametrize("brand", BRANDS)
+def test_field_rounded_up_to_its_modulus_rolls_over(brand):
+    template = getBrandTemplate(brand)
+    registerValues = {}
+    for code, fields in template.registerFields.items():
+        slot = fields[0][1]
+        registerValues[code] = slot.modulus - 10 ** -(slot.decimals + 1) * 4
+    rendered, expected = renderBoth(template, "71234560", None, registerValues)
+    assert rendered == expected
+    assert len(rendered) == template.frameLength
+    assert parseReadout(rendered).valid
+
+def test_template_with_percent_sign_and_repeated_register():
+    template = BrandTemplate("TEST", "\x021.8.0(000012.500*kWh)\r\n0.0.0(12345678)\r\n1.8.0(000012.500*kWh)\r\n"
+                                     "C.1.0(100%)\r\n2.8.0(0042.1*kWh)\r\n!\r\n\x03\x00")
+    assert template.frameFormat is not None
+    rendered, expected = renderBoth(template, "87654321", {"1.8.0": 1.25}, {"2.8.0": 12345.67})
+    assert rendered == expected
+    assert b'1.8.0(000013.750*kWh)' in rendered and b'(2345.7*kWh)' in rendered and b'(100%)' in rendered
+
+def test_render_into_leaves_rest_of_buffer():
+    registry = MeterRegistry(["71234561"], ["LUNA"], [1])
+    registry.setRegisterValue(0, "1.8.0", 1234.5)
+    template = getBrandTemplate("LUNA")
+    buffer = bytearray(b'\xff' * (template.frameLength + 8))
+    assert template.renderInto(buffer, 4, "71234561", None, registry.getRegisterValues(0)) == template.frameLength
+    assert buffer[:4] == b'\xff' * 4 and buffer[-4:] == b'\xff' * 4
+    assert bytes(buffer[4:-4]) == b''.join(iterReadoutFrame(0, registry))
+
+@pytest.mark.parametrize("deviceNumber", range(len(BRANDS)))
+def test_readout_round_trip(registry, deviceNumber):
+    frame = parseReadout(createReadoutFrame(deviceNumber, registry))
+    assert frame.valid
+    assert frame.bcc == frame.expectedBCC
+    records = frame.asDict()
+    assert (records.get("0.0.0") or records.get("C.1.0")).value == SERIAL_NUMBERS[deviceNumber]
+
+@pytest.mark.parametrize("deviceNumber", range(len(BRANDS)))
+def test_readout_register_value_round_trip(registry, deviceNumber):
+    registry.setRegisterValue(deviceNumber, "1.8.0", 1234.5)
+    records = parseReadout(createReadoutFrame(deviceNumber, registry)).asDict()
+    assert float(records["1.8.0"].value) == 1234.5
+
+def test_disabled_meter_sends_no_brand_readout(registry):
+    registry.setEnable(0, False)
+    assert createReadoutFrame(0, registry) == getBrandTemplate(None).render()
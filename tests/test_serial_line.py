@@ -0,0 +1,117 @@
+#Tests of protocol handling of one communication line
+import pytest
+
+from AMRProcess import iterReadoutFrame, ACKNOWLEDGE_TIMEOUT, READOUT_REACTION_DELAY, READOUT_STUCK_TIMEOUT
+from MeterRegistry import MeterRegistry
+from SerialComProcess import SerialLine
+from SessionScheduler import SessionScheduler
+from SimClock import VirtualClock, CLOCK_MODE_SCALED
+from Simulator import Simulator, SimulatorConfig, READOUT_OPTION_SELECT
+from Transport import createLoopbackPair
+
+CONFIG = SimulatorConfig(["71234561", "71234562"], ["LUNA", "MAKEL"])
+
+@pytest.mark.parametrize("failure", [RuntimeError("plugin failed"), OSError("port lost")])
+def test_failed_readout_releases_line(failure, waitFor):
+    renders = []
+    def renderReadout(deviceNumber):
+        renders.append(deviceNumber)
+        if len(renders) == 1:
+            raise failure
+        return iterReadoutFrame(deviceNumber, simulator.registry)
+
+    simulator = Simulator(CONFIG, payloads = renderReadout, clock = VirtualClock())
+    with simulator:
+        simulator.master.write(b'/?71234561!\r\n')
+        simulator.master.read(timeout = 5.0)
+        simulator.master.write(READOUT_OPTION_SELECT)
+        assert waitFor(lambda: renders and not simulator.line.busy)
+        assert simulator.line.session is None
+        assert simulator.transport.baudrate == CONFIG.baudrateInStart
+        assert simulator.requestReadout("71234562").asDict()
+
+#Bus mode, every meter of line hears every request and only the addressed one answers
+BUS_CONFIG = SimulatorConfig(["71234561", "71234562", "71234563"], ["LUNA", "MAKEL", "VIKO"], [1, 1, 0], busMode = True)
+
+@pytest.fixture
+def busSimulator():
+    with Simulator(BUS_CONFIG, clock = VirtualClock()) as simulator:
+        yield simulator
+
+@pytest.mark.parametrize("serialNo", ["71234561", "71234562"])
+def test_bus_mode_addressed_meter_answers(busSimulator, serialNo):
+    records = busSimulator.requestReadout(serialNo).asDict()
+    assert (records.get("0.0.0") or records.get("C.1.0")).value == serialNo
+
+@pytest.mark.parametrize("request_", [b'/?99999999!\r\n', b'/?71234563!\r\n', b'/?!\r\n', READOUT_OPTION_SELECT])
+def test_bus_mode_stays_silent(busSimulator, request_):
+    # unknown and disabled meters, sign-on without address and option select without sign-on get no answer
+    busSimulator.master.write(request_)
+    assert busSimulator.master.read(timeout = 0.2) == b''
+    assert busSimulator.requestReadout("71234561").valid
+
+#Clock advanced by test only, it is not a virtual clock, so session timeouts are armed
+class SteppedClock(VirtualClock):
+    mode = CLOCK_MODE_SCALED
+
+#Line driven by hand on stepped clock, master end of loopback link is returned with it
+def createSteppedLine(config = CONFIG, renderReadout = None):
+    clock = SteppedClock()
+    master, slave = createLoopbackPair()
+    slave.baudrate = config.baudrateInStart
+    registry = MeterRegistry(config.serialNo, config.brand, config.enable)
+    line = SerialLine(slave, SessionScheduler(clock), config, registry, renderReadout)
+    return line, master, clock
+
+def advance(line, clock, seconds):
+    clock.advance(seconds)
+    line.scheduler.runPending()
+
+def test_sign_on_times_out_without_option_select():
+    line, master, clock = createSteppedLine()
+    line.handleRequest(b'/?71234561!\r\n', clock.now())
+    identification = master.readAvailable()
+    assert identification.startswith(b'/')
+    window = line.lineTime(len(identification)) + ACKNOWLEDGE_TIMEOUT
+    advance(line, clock, window - 0.01)
+    assert line.timedOutSignOnCount == 0 and line.session is not None
+    advance(line, clock, 0.02)
+    assert line.timedOutSignOnCount == 1
+    assert line.session is None and line.signOnExpired
+
+    # late option select is not answered, next sign-on is
+    line.handleRequest(READOUT_OPTION_SELECT, clock.now())
+    advance(line, clock, 5.0)
+    assert not line.busy and master.readAvailable() == b''
+    line.handleRequest(b'/?71234561!\r\n', clock.now())
+    assert master.readAvailable() == identification
+
+def test_stuck_timeout_counts_from_end_of_drain():
+    # long frame at 300 baud takes minutes, more than the stuck timeout
+    config = SimulatorConfig(["71234561"], ["LUNA"], baudrateInRuntime = 300)
+    frame = b'\x02' + b'0' * 4000 + b'\x03\x00'
+    line, master, clock = createSteppedLine(config, lambda deviceNumber: frame)
+    line.handleRequest(b'/?71234561!\r\n', clock.now())
+    master.readAvailable()
+    line.handleRequest(READOUT_OPTION_SELECT, clock.now())
+    advance(line, clock, READOUT_REACTION_DELAY)
+    assert master.readAvailable() == frame
+    advance(line, clock, READOUT_STUCK_TIMEOUT + 1.0)
+    assert line.busy and line.timedOutReadoutCount == 0
+    advance(line, clock, 200.0)
+    assert not line.busy and line.timedOutReadoutCount == 0
+
+def test_stuck_readout_releases_line():
+    config = SimulatorConfig(["71234561"], ["LUNA"])
+    line, master, clock = createSteppedLine(config)
+    # readout is never reported drained
+    line.finishReadout = lambda deviceNumber: None
+    line.handleRequest(b'/?71234561!\r\n', clock.now())
+    line.handleRequest(READOUT_OPTION_SELECT, clock.now())
+    advance(line, clock, READOUT_REACTION_DELAY)
+    assert line.busy and line.transport.baudrate == config.baudrateInRuntime
+    # drain wait of frame at 9600 baud is well below ten seconds
+    advance(line, clock, READOUT_STUCK_TIMEOUT + 10.0)
+    assert line.timedOutReadoutCount == 1
+    assert not line.busy and line.session is None
+    assert line.transport.baudrate == config.baudrateInStart
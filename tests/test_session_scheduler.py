@@ -0,0 +1,42 @@
+#Tests of session scheduler on virtual clock
+#Run from repository root: python -m pytest
+from SessionScheduler import SessionScheduler
+from SimClock import VirtualClock
+
+def test_scheduler_runs_due_actions_in_deadline_order():
+    clock = VirtualClock()
+    scheduler = SessionScheduler(clock)
+    executed = []
+    scheduler.callAt(2.0, executed.append, "late")
+    scheduler.callAt(1.0, executed.append, "early")
+    scheduler.callAt(1.0, executed.append, "early second")
+    scheduler.callAt(1.5, executed.append, "cancelled").cancel()
+    assert scheduler.runPending() == 0
+    clock.advance(1.5)
+    assert scheduler.runPending() == 2
+    clock.advance(1.0)
+    assert scheduler.runPending() == 1
+    assert executed == ["early", "early second", "late"]
+
+def test_scheduler_counts_actions_late_beyond_budget():
+    clock = VirtualClock()
+    scheduler = SessionScheduler(clock)
+    scheduler.callAt(1.0, lambda: None, budget = 0.2)
+    scheduler.callAt(1.0, lambda: None, budget = 1.0)
+    scheduler.callAt(1.0, lambda: None)
+    clock.advance(1.5)
+    assert scheduler.runPending() == 3
+    report = scheduler.jitterReport()
+    assert report["windowMisses"] == 1
+    assert report["executed"] == 3
+    assert report["jitterMax"] == 0.5
+    assert report["pending"] == 0
+
+def test_scheduler_survives_failing_action():
+    clock = VirtualClock()
+    scheduler = SessionScheduler(clock)
+    executed = []
+    scheduler.callSoon(lambda: 1 / 0)
+    scheduler.callSoon(executed.append, "next")
+    assert scheduler.runPending() == 2
+    assert executed == ["next"]
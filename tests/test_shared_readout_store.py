@@ -0,0 +1,51 @@
+#Tests of readout store shared by worker processes
+import pytest
+
+import MeterRegistry as MeterRegistryModule
+from AMRProcess import createReadoutFrame
+from MeterRegistry import MeterRegistry
+from ReadoutParser import parseReadout
+from ReadoutTemplate import ETX, getBrandTemplate
+from SharedReadoutStore import attachSharedReadoutStore, buildSharedReadoutStore
+from SimClock import VirtualClock
+from Simulator import Simulator, SimulatorConfig, READOUT_OPTION_SELECT
+
+CONFIG = SimulatorConfig(["71234561", "71234562"], ["LUNA", "MAKEL"])
+
+#Workers of rendering pool are forked, they render meters of global registry
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MeterRegistry(CONFIG.serialNo, CONFIG.brand, CONFIG.enable)
+    monkeypatch.setattr(MeterRegistryModule, "registry", registry)
+    return registry
+
+@pytest.fixture
+def renderer(registry, tmp_path):
+    path = buildSharedReadoutStore(registry, path = str(tmp_path / "readouts.iec"), workers = 1)
+    renderer = attachSharedReadoutStore(path, registry)
+    yield renderer
+    renderer.close()
+
+def test_store_serves_rendered_frames(registry, renderer):
+    for deviceNumber in range(len(registry)):
+        assert bytes(renderer(deviceNumber)) == createReadoutFrame(deviceNumber, registry)
+    assert renderer.stats()["sharedReadouts"] == len(registry)
+
+def test_changed_and_invalidated_meters_are_rendered_live(registry, renderer):
+    registry.setRegisterValue(0, "1.8.0", 42.0)
+    assert renderer(0) == createReadoutFrame(0, registry)
+    renderer.invalidate()
+    assert renderer(1) == createReadoutFrame(1, registry)
+    assert renderer.stats()["liveReadouts"] == 2
+
+def test_unknown_device_number_gets_no_brand_readout(renderer):
+    assert renderer(-1) == getBrandTemplate(None).render()
+
+def test_option_select_without_sign_on(registry, renderer):
+    with Simulator(CONFIG, payloads = renderer, clock = VirtualClock(), registry = registry) as simulator:
+        simulator.master.write(READOUT_OPTION_SELECT)
+        frame = simulator.master.read(expected = ETX, timeout = 5.0) + simulator.master.readAvailable()
+        assert frame == getBrandTemplate(None).render()
+        # line is released, next master is answered
+        assert parseReadout(frame).valid
+        assert simulator.requestReadout("71234562").asDict()
@@ -0,0 +1,37 @@
+#Tests of simulator on loopback link
+#Run from repository root: python -m pytest
+import pytest
+
+from SimClock import VirtualClock
+from Simulator import Simulator, SimulatorConfig
+from Transport import createLoopbackPair
+
+BRANDS = ("LUNA", "MAKEL", "VIKO", "KOHLER")
+SERIAL_NUMBERS = ("71234561", "71234562", "71234563", "71234564")
+
+#Data set line carrying serial number of meter, built-in readouts print it in 0.0.0 or C.1.0
+def serialRecord(frame):
+    records = frame.asDict()
+    return records.get("0.0.0") or records.get("C.1.0")
+
+@pytest.mark.parametrize("deviceNumber", range(len(BRANDS)))
+def test_simulator_readout(deviceNumber):
+    config = SimulatorConfig(SERIAL_NUMBERS, BRANDS)
+    with Simulator(config, clock = VirtualClock()) as simulator:
+        frame = simulator.requestReadout(SERIAL_NUMBERS[deviceNumber])
+    assert serialRecord(frame).value == SERIAL_NUMBERS[deviceNumber]
+
+def test_simulator_restart():
+    config = SimulatorConfig(SERIAL_NUMBERS, BRANDS)
+    simulator = Simulator(config, clock = VirtualClock())
+    for _ in range(2):
+        with simulator:
+            assert serialRecord(simulator.requestReadout(SERIAL_NUMBERS[0])).value == SERIAL_NUMBERS[0]
+
+def test_simulator_on_given_transport_is_not_restarted():
+    master, slave = createLoopbackPair()
+    simulator = Simulator(SimulatorConfig(SERIAL_NUMBERS, BRANDS), transport = slave, clock = VirtualClock())
+    simulator.start()
+    simulator.stop()
+    with pytest.raises(RuntimeError):
+        simulator.start()
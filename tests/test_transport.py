@@ -0,0 +1,169 @@
+#Tests of byte transports
+import os
+import socket
+import time
+
+import pytest
+
+from SimClock import VirtualClock
+from Transport import PacedTransport, RxBufferedTransport, RxRingBuffer, TcpTransport, Transport
+from Transport import bitsPerCharacter, createLoopbackPair, isPseudoTerminal, openTransport
+
+@pytest.fixture
+def tcpTransport():
+    transport = RxBufferedTransport(TcpTransport("127.0.0.1", 0, 300))
+    yield transport
+    transport.close()
+
+def connectMaster(transport):
+    host, port = transport.inner.server.getsockname()
+    return socket.create_connection((host, port))
+
+def test_tcp_write_without_master_fails_at_once(tcpTransport):
+    start = time.monotonic()
+    with pytest.raises(OSError):
+        tcpTransport.write(b'/LUN5<1>LUN12345678\r\n')
+    assert time.monotonic() - start < 0.5
+
+def test_tcp_write_after_master_disconnects_does_not_block(tcpTransport, waitFor):
+    master = connectMaster(tcpTransport)
+    master.sendall(b'/?12345678!\r\n')
+    assert tcpTransport.read(timeout = 2.0) == b'/?12345678!\r\n'
+    master.close()
+    assert waitFor(lambda: tcpTransport.inner.connection is None)
+
+    start = time.monotonic()
+    with pytest.raises(OSError):
+        tcpTransport.write(b'\x02readout\x03\x00')
+    assert time.monotonic() - start < 0.5
+
+    # next master is accepted by RX pump and answered
+    master = connectMaster(tcpTransport)
+    master.sendall(b'/?87654321!\r\n')
+    assert tcpTransport.read(timeout = 2.0) == b'/?87654321!\r\n'
+    tcpTransport.write(b'/LUN5\r\n')
+    master.settimeout(2.0)
+    assert master.recv(64) == b'/LUN5\r\n'
+    master.close()
+
+def test_ring_buffer_wraparound():
+    ring = RxRingBuffer(16)
+    lines = [b'/?%08d!\r\n' % _ for _ in range(20)]
+    received = []
+    for line in lines:
+        # line is written in two reads, second one may wrap at the end of buffer
+        for part in (line[:5], line[5:]):
+            view = ring.writableView()
+            count = min(len(view), len(part))
+            view[:count] = part[:count]
+            ring.commit(count)
+            if count < len(part):
+                rest = part[count:]
+                ring.writableView()[:len(rest)] = rest
+                ring.commit(len(rest))
+        received.append(ring.readLine(b'\r\n'))
+    assert received == lines
+    assert ring.overrunCount == 0
+    assert len(ring) == 0
+
+def test_ring_buffer_terminator_straddles_end():
+    ring = RxRingBuffer(8)
+    ring.writableView()[:6] = b'abcdef'
+    ring.commit(6)
+    assert ring.take(6) == b'abcdef'
+    ring.writableView()[:2] = b'g\r'
+    ring.commit(2)
+    assert ring.readLine(b'\r\n') is None
+    ring.writableView()[:1] = b'\n'
+    ring.commit(1)
+    assert ring.readLine(b'\r\n') == b'g\r\n'
+
+def test_ring_buffer_overrun_drops_oldest_half():
+    ring = RxRingBuffer(8)
+    view = ring.writableView()
+    view[:8] = b'01234567'
+    ring.commit(8)
+    view = ring.writableView()
+    assert len(view) == 4
+    view[:4] = b'89ab'
+    ring.commit(4)
+    assert ring.overrunCount == 1
+    assert ring.overrunBytes == 4
+    assert ring.takeAll() == b'456789ab'
+
+#Port handing over prepared chunks, one per readInto call
+class ChunkPort(Transport):
+    def __init__(self, chunks):
+        self.name = "chunks"
+        self.chunks = list(chunks)
+
+    def readInto(self, view, timeout):
+        if not self.chunks:
+            time.sleep(timeout)
+            return 0
+        chunk = self.chunks[0]
+        count = min(len(view), len(chunk))
+        view[:count] = chunk[:count]
+        if count < len(chunk):
+            self.chunks[0] = chunk[count:]
+        else:
+            self.chunks.pop(0)
+        return count
+
+def test_buffered_transport_joins_lines_split_across_reads(waitFor):
+    transport = RxBufferedTransport(ChunkPort([b'/?1234', b'5678!\r', b'\n/?8765', b'4321!\r\n']), capacity = 64)
+    try:
+        assert transport.read(timeout = 2.0) == b'/?12345678!\r\n'
+        assert transport.read(timeout = 2.0) == b'/?87654321!\r\n'
+        assert transport.read(timeout = 0.05) == b''
+        stats = transport.stats()
+        assert stats["rxBytes"] == 26
+        assert stats["overrunCount"] == 0
+    finally:
+        transport.close()
+
+def test_paced_transport_takes_character_time_of_line():
+    clock = VirtualClock()
+    master, slave = createLoopbackPair()
+    slave.baudrate = 300
+    transport = PacedTransport(slave, 7, "E", 1, clock)
+    try:
+        payload = b'/LUN5<1>LUN71234561\r\n' * 3
+        transport.write(payload)
+        transport.drain()
+        assert master.readAvailable() == payload
+        assert clock.now() == pytest.approx(len(payload) * bitsPerCharacter(7, "E", 1) / 300)
+        assert transport.stats()["txBytes"] == len(payload)
+    finally:
+        transport.close()
+
+def test_paced_transport_counts_baud_change_before_drain():
+    master, slave = createLoopbackPair()
+    slave.baudrate = 300
+    transport = PacedTransport(slave, 7, "E", 1)
+    try:
+        # first burst of the FIFO leaves after half a second at 300 baud
+        transport.write(b'0' * 32)
+        transport.setBaud(9600)
+        stats = transport.stats()
+        assert stats["lateBaudChangeCount"] == 1
+        assert stats["lateBaudChangeBytes"] == 32
+    finally:
+        transport.close()
+
+def test_existing_pseudo_terminal_is_paced_on_request():
+    masterFd, slaveFd = os.openpty()
+    portName = os.ttyname(slaveFd)
+    assert isPseudoTerminal(portName)
+    assert not isPseudoTerminal("/dev/ttyUSB0")
+    try:
+        for lineRate, transportClass in ((False, RxBufferedTransport), (True, PacedTransport)):
+            # some pseudo terminal drivers refuse 7E1 framing, 8N1 is accepted by all of them
+            transport = openTransport(portName, 300, 8, "N", 1, lineRate)
+            try:
+                assert type(transport) is transportClass
+            finally:
+                transport.close()
+    finally:
+        os.close(masterFd)
+        os.close(slaveFd)